@@ -11,6 +11,7 @@ import traceback
 import signal
 import sys
 from .Plugin import Plugin, PluginContext
+from .TimerService import TimerService
 
 class mainthread(object):
 	def __init__(self, f):
@@ -67,12 +68,38 @@ class Application(object):
 		self.__isJoining = False
 		self.__tasks = []
 		self.__taskLock = threading.Condition(threading.Lock())
+		self.__timerService = TimerService(self.queue)
 		signal.signal(signal.SIGINT, self.__signal)
 		signal.signal(signal.SIGTERM, self.__signal)
 		Application._mainThread = threading.currentThread()
 		if run:
 			self.run()
 
+	def callLater(self, seconds, fn, *args, **kwargs):
+		"""
+		Call a function after a delay. The call will be made by the main thread.
+		All timers share one thread so use this instead of starting a
+		:class:`threading.Timer`.
+
+		:param float seconds: The delay in seconds.
+		:param func fn: The function to be called. Any extra parameters are
+		  passed to the function.
+
+		:returns: a handle. Call ``cancel()`` on the handle to cancel the timer.
+		"""
+		return self.__timerService.callLater(seconds, fn, *args, **kwargs)
+
+	def callLaterInTimerThread(self, seconds, fn, *args, **kwargs):
+		"""
+		Like :func:`callLater` but the function is called directly by the timer
+		thread and not by the main thread. Use this only for short, thread safe
+		functions, e.g. to wake up another thread, that must not be delayed by
+		a busy main thread.
+
+		:returns: a handle. Call ``cancel()`` on the handle to cancel the timer.
+		"""
+		return self.__timerService.callLaterInTimerThread(seconds, fn, *args, **kwargs)
+
 	@staticmethod
 	def defaultContext():
 		""":returns: the default context used by the application"""
@@ -198,6 +225,7 @@ class Application(object):
 			self.running = False
 			self.exitCode = exitCode
 			self.__isJoining = True
+		self.__timerService.stop()
 
 		self.__taskLock.acquire()
 		try:
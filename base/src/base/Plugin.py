@@ -55,6 +55,10 @@ class ObserverCollection(property):
 				logging.exception(e)
 		return Observers(self.interface, c)
 
+	def implementationCount(self):
+		"""Returns the number of loaded classes implementing the interface"""
+		return len(PluginMeta._registry.get(self.interface, ()))
+
 class IInterface(object):
 	"""Base class for interfaces"""
 
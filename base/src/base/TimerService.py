@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+
+import errno
+import heapq
+import itertools
+import logging
+import os
+import select
+import threading
+import time
+
+class TimerHandle(object):
+	"""
+	A handle to a timer started with :func:`Application.callLater`.
+	"""
+	def __init__(self, service, fn, args, kwargs, inTimerThread=False):
+		super(TimerHandle, self).__init__()
+		self.service = service
+		self.fn = fn
+		self.args = args
+		self.kwargs = kwargs
+		self.inTimerThread = inTimerThread
+		self.cancelled = False
+
+	def cancel(self):
+		"""
+		Cancel the timer. The function will not be called, even if the timer
+		has expired but the call has not yet been made by the main thread.
+		"""
+		if self.cancelled:
+			return
+		self.cancelled = True
+		self.service.timerCancelled()
+
+	def run(self):
+		if self.cancelled:
+			return
+		self.cancelled = True
+		self.fn(*self.args, **self.kwargs)
+
+class TimerService(object):
+	"""
+	Runs all timers from one thread. The timers are kept in a heap ordered by
+	the time they expire and the thread sleeps until the first one expires.
+	Expired timers are delivered using the supplied function, normally
+	:func:`Application.queue`.
+
+	The thread sleeps in :func:`select.select` on a pipe instead of
+	:func:`threading.Condition.wait`. With a timeout, the latter polls every
+	50 ms in Python 2.
+	"""
+
+	def __init__(self, deliver):
+		super(TimerService, self).__init__()
+		self.deliver = deliver
+		self.timers = []
+		self.cancelledCount = 0
+		self.counter = itertools.count()
+		self.lock = threading.Lock()
+		self.running = True
+		self.thread = None
+		# Written to when the thread must recalculate the time to sleep
+		self.wakeupRead, self.wakeupWrite = os.pipe()
+
+	def callLater(self, seconds, fn, *args, **kwargs):
+		return self.__add(seconds, TimerHandle(self, fn, args, kwargs))
+
+	def callLaterInTimerThread(self, seconds, fn, *args, **kwargs):
+		return self.__add(seconds, TimerHandle(self, fn, args, kwargs, inTimerThread=True))
+
+	def __add(self, seconds, handle):
+		with self.lock:
+			if not self.running:
+				# Shutting down, the timer will never expire
+				return handle
+			heapq.heappush(self.timers, (time.time() + seconds, next(self.counter), handle))
+			if self.thread is None:
+				self.thread = threading.Thread(target=self.__run, name='Timers')
+				self.thread.daemon = True
+				self.thread.start()
+			elif self.timers[0][2] is handle:
+				# Expires before all other timers
+				self.__wakeup()
+		return handle
+
+	def stop(self):
+		with self.lock:
+			if not self.running:
+				return
+			self.running = False
+			if self.thread is None:
+				os.close(self.wakeupRead)
+				os.close(self.wakeupWrite)
+				return
+			self.__wakeup()
+
+	def timerCancelled(self):
+		with self.lock:
+			self.cancelledCount = self.cancelledCount + 1
+			if self.cancelledCount > 32 and self.cancelledCount > len(self.timers) / 2:
+				# Do not keep a lot of cancelled timers around until they expire
+				self.timers = [timer for timer in self.timers if not timer[2].cancelled]
+				heapq.heapify(self.timers)
+				self.cancelledCount = 0
+
+	def __run(self):
+		while True:
+			with self.lock:
+				handle = None
+				delay = None
+				while self.running and self.timers:
+					expires, __counter, timer = self.timers[0]
+					if timer.cancelled:
+						heapq.heappop(self.timers)
+						self.cancelledCount = max(0, self.cancelledCount - 1)
+						continue
+					delay = expires - time.time()
+					if delay <= 0:
+						handle = heapq.heappop(self.timers)[2]
+					break
+				if not self.running:
+					os.close(self.wakeupRead)
+					os.close(self.wakeupWrite)
+					return
+			if handle is not None and handle.inTimerThread:
+				try:
+					handle.run()
+				except Exception as error:
+					logging.exception(error)
+				continue
+			if handle is not None:
+				self.deliver(handle.run)
+				continue
+			# Sleep until the first timer expires or we are woken up. A wakeup
+			# written after the delay was calculated makes select return directly.
+			try:
+				readable, __writable, __errors = select.select([self.wakeupRead], [], [], delay)
+			except select.error as error:
+				if error.args[0] != errno.EINTR:
+					raise
+				continue
+			if readable:
+				os.read(self.wakeupRead, 512)
+
+	def __wakeup(self):
+		# Must be called with the lock held
+		os.write(self.wakeupWrite, 'x')
@@ -14,5 +14,5 @@ setup(
 	entry_points={ \
 		'telldus.startup': ['c = events.base:EventManager [cREQ]']
 	},
-	extras_require = dict(cREQ = "Base>=0.1\nTelldusLive>=0.1")
+	extras_require = dict(cREQ = "API>=0.1\nBase>=0.1\nTelldusLive>=0.1")
 )
@@ -1,26 +1,25 @@
 # -*- coding: utf-8 -*-
 
 import logging
-from threading import Timer
 import time
 
-from base import Application, mainthread, Settings
+from base import Application, mainthread
 from tellduslive.base import LiveMessage
 
 class Action(object):
 	# pylint: disable=W0622
-	def __init__(self, event, id, delay, delayPolicy, delayExecTime=None, *__args, **__kwargs):
+	def __init__(self, event, id, delay, delayPolicy, *__args, **__kwargs):
 		super(Action, self).__init__()
 		self.event = event
 		self.id = id  # pylint: disable=C0103
 		self.delay = delay
 		self.delayPolicy = delayPolicy
+		# Set when waiting for a delay, restored from the delayed action queue
 		self.delayExecTime = None
-		if delayExecTime:
-			self.delayExecTime = float(delayExecTime)
 		self.timeout = None
 		self.triggerInfo = None
-		self.settings = Settings('telldus.event')
+		# Trace of the event execution that started this action, if any
+		self.trace = None
 		Application().registerShutdown(self.stop)
 
 	def close(self):
@@ -34,6 +33,8 @@ class Action(object):
 		if 'delayExecTime' not in storedAction \
 		   or storedAction['delay'] != self.delay \
 		   or storedAction['delayPolicy'] != self.delayPolicy:
+			# The action has changed, forget the delay
+			self.updateStoredAction()
 			return
 		# action is waiting for a delay, and delaytime or delaypolicy hasn't been changed,
 		# so readd this delay
@@ -53,8 +54,7 @@ class Action(object):
 			# still waiting to execute this action, start a new delayTimer
 			if self.timeout:
 				self.timeout.cancel()
-			self.timeout = Timer(self.delayExecTime - time.time(), self.executeDelayed)
-			self.timeout.start()
+			self.timeout = Application().callLater(self.delayExecTime - time.time(), self.executeDelayed)
 
 	def execute(self, triggerInfo={}):  # pylint: disable=W0102
 		pass
@@ -64,7 +64,7 @@ class Action(object):
 		triggerInfo = self.triggerInfo
 		self.triggerInfo = None
 		self.updateStoredAction()
-		self.execute(triggerInfo)
+		self.__run(triggerInfo)
 
 	def loadParams(self, params):
 		for param in params:
@@ -77,20 +77,21 @@ class Action(object):
 	def parseParam(self, name, value):
 		pass
 
-	def start(self, triggerInfo=None):
+	def start(self, triggerInfo=None, trace=None):
 		triggerInfo = triggerInfo or {}
 		if self.delay == 0:
-			self.execute(triggerInfo)
+			self.trace = trace
+			self.__run(triggerInfo)
 			return
 		else:
 			if self.delayPolicy == "continue" and self.delayExecTime:
 				# already waiting for this action, do nothing
 				return
+		self.trace = trace
 		if self.timeout:
 			self.timeout.cancel()
 		self.triggerInfo = triggerInfo
-		self.timeout = Timer(self.delay, self.executeDelayed)
-		self.timeout.start()
+		self.timeout = Application().callLater(self.delay, self.executeDelayed)
 		self.delayExecTime = time.time() + self.delay
 		self.updateStoredAction()
 
@@ -101,25 +102,25 @@ class Action(object):
 	def triggered(self):
 		self.event.execute(self)
 
+	def __run(self, triggerInfo):
+		if self.trace is not None:
+			self.trace.record('actionExecute', self.id)
+		self.execute(triggerInfo)
+
 	@mainthread
 	def updateStoredAction(self):
-		storeddata = self.settings.get('events', {})
-		eventId = str(self.event.eventId)
-		if eventId in storeddata:
-			if 'actions' in storeddata[eventId]:
-				actions = storeddata[eventId]['actions']
-				if str(self.id) in actions:
-					action = actions[str(self.id)]
-					if self.delayExecTime:
-						action['delayExecTime'] = self.delayExecTime
-						action['triggerInfo'] = self.triggerInfo
-					else:
-						try:
-							del action['delayExecTime']
-							del action['triggerInfo']
-						except Exception as __e:
-							pass
-		self.settings['events'] = storeddata
+		delayedActions = self.event.manager.delayedActions
+		if self.delayExecTime:
+			delayedActions.add(
+				self.event.eventId,
+				self.id,
+				self.delayExecTime,
+				self.triggerInfo,
+				self.delay,
+				self.delayPolicy
+			)
+		else:
+			delayedActions.remove(self.event.eventId, self.id)
 
 class RemoteAction(Action):
 	def __init__(self, **kwargs):
@@ -0,0 +1,344 @@
+# -*- coding: utf-8 -*-
+
+"""
+Offline benchmark for the event engine.
+
+Loads a synthetic ``events-report`` with ``N`` events into
+:py:class:`EventManager` and streams device state changes and sensor values
+through :py:class:`DeviceEventFactory`, the same way the device manager does.
+Telldus Live! and the device manager are replaced by stubs in the plugin
+context so no server connection or hardware is needed. Settings and delayed
+actions are kept in a temporary directory. The ``telldus`` package must be
+installed.
+
+Each event has one or more device or sensor triggers, local device and
+sensor conditions and a device action. Some triggers use devices and sensors
+that never reports anything.
+
+Usage::
+
+  python -m events.base.Benchmark [--events=N] [--triggers=N] [--conditions=N]
+                                  [--devices=N] [--sensors=N] [--updates=N]
+                                  [--passes=N] [--save-baseline=FILE]
+                                  [--baseline=FILE] [--tolerance=PERCENT]
+
+``--triggers`` and ``--conditions`` are the number of triggers and
+conditions per event.
+
+If a baseline is given, the exit code is 1 when the throughput or the time
+spent per update is worse than the baseline by more than the tolerance. A
+reference baseline for the default options is stored in
+``events/benchmark-baseline.json``. It was measured on a development
+machine, save a new baseline when comparing on other hardware.
+"""
+
+import getopt
+import json
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from base import Application, PluginContext
+from board import Board
+from telldus import Device, DeviceManager
+from tellduslive.base import TelldusLive
+from telldus.DeviceEventFactory import DeviceEventFactory, DeviceTrigger, SensorTrigger
+
+from .EventManager import EventManager
+
+VALUE_TYPES = [
+	('temp', Device.TEMPERATURE, -20, 35),
+	('humidity', Device.HUMIDITY, 10, 90),
+]
+
+class StubDevice(object):
+	def __init__(self, deviceId, manager):
+		self.deviceId = deviceId
+		self.manager = manager
+		self.method = Device.TURNOFF
+		self.values = {}
+
+	def command(self, __method, __value, origin=None, success=None, failure=None):  # pylint: disable=W0613
+		self.manager.count('command')
+		if success:
+			success()
+
+	def id(self):  # pylint: disable=C0103
+		return self.deviceId
+
+	def sensorValue(self, valueType, scale):
+		return self.values.get((valueType, scale))
+
+	def state(self):
+		return (self.method, None)
+
+	@staticmethod
+	def typeString():
+		return 'benchmark'
+
+class StubDeviceManager(object):
+	"""Holds the stub devices and counts the calls made by the events"""
+	def __init__(self):
+		self.calls = {}
+		self.devices = {}
+
+	def count(self, name):
+		self.calls[name] = self.calls.get(name, 0) + 1
+
+	def device(self, deviceId):
+		self.count('device')
+		return self.devices.get(deviceId)
+
+class StubLive(object):
+	"""Counts the messages the events sends to Telldus Live!"""
+	def __init__(self):
+		self.calls = {}
+
+	def pushToWeb(self, module, action, __data):
+		name = '%s.%s' % (module, action)
+		self.calls[name] = self.calls.get(name, 0) + 1
+
+	def send(self, __msg):
+		self.calls['send'] = self.calls.get('send', 0) + 1
+
+class StubMessage(object):
+	def __init__(self, data):
+		self.data = data
+
+	def argument(self, __index):
+		return self
+
+	def toNative(self):
+		return self.data
+
+class CallCounter(object):
+	"""Counts the calls to a method on all instances of a class"""
+	def __init__(self):
+		self.count = 0
+
+	def wrap(self, cls, name):
+		method = getattr(cls, name)
+		def fn(*args, **kwargs):
+			self.count = self.count + 1
+			return method(*args, **kwargs)
+		setattr(cls, name, fn)
+
+def generateReport(eventCount, triggerCount, conditionCount, deviceCount, sensorCount):
+	"""
+	Generate the payload of an events-report. Device and sensor ids above the
+	configured counts are used for triggers that never fires.
+	"""
+	rnd = random.Random(4711)
+	data = {}
+	for eventId in range(1, eventCount+1):
+		triggers = {}
+		for triggerId in range(1, triggerCount+1):
+			if rnd.random() < 0.5:
+				triggers[str(triggerId)] = {'type': 'device', 'params': {
+					'clientDeviceId': rnd.randint(1, deviceCount*2),
+					'method': rnd.choice([Device.TURNON, Device.TURNOFF]),
+				}}
+				continue
+			name, __valueType, low, high = rnd.choice(VALUE_TYPES)
+			triggers[str(triggerId)] = {'type': 'sensor', 'params': {
+				'clientSensorId': 100000 + rnd.randint(1, sensorCount*2),
+				'valueType': name,
+				'scale': 0,
+				'value': rnd.randint(low, high),
+				'edge': rnd.choice([-1, 1]),
+				'reloadValue': 1,
+			}}
+		conditions = {}
+		for conditionId in range(1, conditionCount+1):
+			# Spread the conditions over two groups, either may pass
+			group = conditionId % 2
+			if rnd.random() < 0.5:
+				conditions[str(conditionId)] = {'type': 'device', 'group': group, 'params': {
+					'local': 1,
+					'clientDeviceId': rnd.randint(1, deviceCount),
+					'method': rnd.choice([Device.TURNON, Device.TURNOFF]),
+				}}
+				continue
+			name, __valueType, low, high = rnd.choice(VALUE_TYPES)
+			conditions[str(conditionId)] = {'type': 'sensor', 'group': group, 'params': {
+				'local': 1,
+				'clientSensorId': 100000 + rnd.randint(1, sensorCount),
+				'valueType': name,
+				'scale': 0,
+				'value': rnd.randint(low, high),
+				'edge': rnd.choice([-1, 1]),
+			}}
+		data[str(eventId)] = {
+			'minRepeatInterval': 0,
+			'description': 'Event %i' % eventId,
+			'triggers': triggers,
+			'conditions': conditions,
+			'actions': {
+				'1': {'type': 'device', 'delay': 0, 'delayPolicy': 'restart', 'params': {
+					'local': 1,
+					'clientDeviceId': rnd.randint(1, deviceCount),
+					'method': Device.TURNON,
+					'repeats': 1,
+				}},
+			},
+		}
+	return data
+
+def generateUpdates(deviceCount, sensorCount, count):
+	"""Generate a mix of device state changes and sensor values"""
+	rnd = random.Random(42)
+	updates = []
+	for __i in range(count):
+		if rnd.random() < 0.4:
+			updates.append(('device', rnd.randint(1, deviceCount), rnd.choice([Device.TURNON, Device.TURNOFF])))
+			continue
+		__name, valueType, low, high = rnd.choice(VALUE_TYPES)
+		updates.append(('sensor', 100000 + rnd.randint(1, sensorCount), (valueType, rnd.randint(low, high))))
+	return updates
+
+def setup(deviceCount, sensorCount, configDir):
+	Application(run=False)
+	deviceManager = StubDeviceManager()
+	for deviceId in range(1, deviceCount+1):
+		deviceManager.devices[deviceId] = StubDevice(deviceId, deviceManager)
+	for sensorId in range(100001, 100001+sensorCount):
+		deviceManager.devices[sensorId] = StubDevice(sensorId, deviceManager)
+
+	# Keep the settings and the delayed actions away from the real configuration
+	Board.configDir = staticmethod(lambda: configDir)
+	context = PluginContext()
+	context.components[DeviceManager] = deviceManager
+	context.components[TelldusLive] = StubLive()
+	# The factory must be created first, the manager looks it up as an observer
+	factory = DeviceEventFactory(context)
+	manager = EventManager(context)
+	# Loading the events would otherwise schedule a write of the settings file
+	manager.settings = {}
+	return manager, factory, deviceManager
+
+def runPass(factory, deviceManager, updates, latencies):
+	start = time.time()
+	for kind, deviceId, value in updates:
+		device = deviceManager.devices[deviceId]
+		updateStart = time.time()
+		if kind == 'device':
+			device.method = value
+			factory.stateChanged(device, value, None)
+		else:
+			valueType, sensorValue = value
+			device.values[(valueType, 0)] = sensorValue
+			factory.sensorValueReceived(device, valueType, sensorValue, 0)
+		latencies.setdefault(kind, []).append(time.time() - updateStart)
+	return time.time() - start
+
+def percentile(values, pct):
+	values = sorted(values)
+	return values[min(len(values)-1, int(len(values)*pct/100.0))]
+
+def report(updateCount, elapsed, evaluated, latencies, live, deviceManager):
+	result = {
+		'updatesPerSecond': updateCount / elapsed if elapsed > 0 else 0,
+		'triggersPerSecond': evaluated / elapsed if elapsed > 0 else 0,
+		'updates': {},
+	}
+	print('Updates: %i in %.3f s, %.0f updates/s' % (updateCount, elapsed, result['updatesPerSecond']))
+	print('Triggers evaluated: %i, %.0f triggers/s' % (evaluated, result['triggersPerSecond']))
+	print('%-12s %8s %10s %10s %10s' % ('update', 'count', 'mean us', 'p50 us', 'p95 us'))
+	for kind in sorted(latencies):
+		values = latencies[kind]
+		mean = sum(values) / len(values) * 1e6
+		result['updates'][kind] = mean
+		print('%-12s %8i %10.1f %10.1f %10.1f' % (
+			kind, len(values), mean, percentile(values, 50)*1e6, percentile(values, 95)*1e6
+		))
+	print('Live calls: %s' % ', '.join(
+		['%s=%i' % (name, live.calls[name]) for name in sorted(live.calls)]
+	))
+	print('Device manager calls: %s' % ', '.join(
+		['%s=%i' % (name, deviceManager.calls[name]) for name in sorted(deviceManager.calls)]
+	))
+	return result
+
+def compare(result, baseline, tolerance):
+	"""Returns a list of regressions compared to the baseline"""
+	regressions = []
+	limit = 1 + tolerance/100.0
+	if result['updatesPerSecond'] * limit < baseline.get('updatesPerSecond', 0):
+		regressions.append('throughput %.0f updates/s, baseline %.0f' % (
+			result['updatesPerSecond'], baseline['updatesPerSecond']
+		))
+	for kind, mean in result['updates'].items():
+		baselineMean = baseline.get('updates', {}).get(kind)
+		if baselineMean and mean > baselineMean * limit:
+			regressions.append('%s %.1f us, baseline %.1f us' % (kind, mean, baselineMean))
+	return regressions
+
+def main(argv):
+	opts, __args = getopt.getopt(argv, '', [
+		'events=', 'triggers=', 'conditions=', 'devices=', 'sensors=', 'updates=', 'passes=',
+		'baseline=', 'save-baseline=', 'tolerance='
+	])
+	options = dict(opts)
+	eventCount = int(options.get('--events', 200))
+	triggerCount = int(options.get('--triggers', 2))
+	conditionCount = int(options.get('--conditions', 2))
+	deviceCount = int(options.get('--devices', 100))
+	sensorCount = int(options.get('--sensors', 30))
+	passes = int(options.get('--passes', 5))
+	tolerance = float(options.get('--tolerance', 20))
+
+	configDir = tempfile.mkdtemp()
+	try:
+		manager, factory, deviceManager = setup(deviceCount, sensorCount, configDir)
+		data = generateReport(eventCount, triggerCount, conditionCount, deviceCount, sensorCount)
+		start = time.time()
+		manager.receiveEventsFromServer(StubMessage(data))
+		print('Loaded %i events in %.1f ms' % (len(manager.events), (time.time() - start)*1000))
+		start = time.time()
+		manager.receiveEventsFromServer(StubMessage(data))
+		print('Reloaded unchanged events in %.1f ms' % ((time.time() - start)*1000))
+
+		evaluated = CallCounter()
+		evaluated.wrap(DeviceTrigger, 'triggered')
+		evaluated.wrap(SensorTrigger, 'triggerSensorUpdate')
+		updates = generateUpdates(deviceCount, sensorCount, int(options.get('--updates', 5000)))
+		# Let the sensor triggers see their first value before measuring
+		runPass(factory, deviceManager, updates, {})
+		evaluated.count = 0
+		manager.live.calls = {}
+		deviceManager.calls = {}
+
+		print('Streaming %i updates %i times, %i events, %i triggers and %i conditions per event' % (
+			len(updates), passes, eventCount, triggerCount, conditionCount
+		))
+		latencies = {}
+		elapsed = 0
+		for __i in range(passes):
+			elapsed += runPass(factory, deviceManager, updates, latencies)
+		result = report(
+			len(updates)*passes, elapsed, evaluated.count, latencies, manager.live, deviceManager
+		)
+		manager.delayedActions.close()
+	finally:
+		shutil.rmtree(configDir)
+
+	if '--save-baseline' in options:
+		with open(options['--save-baseline'], 'w') as fd:
+			json.dump(result, fd, indent=2, separators=(',', ': '), sort_keys=True)
+			fd.write('\n')
+		print('Baseline saved to %s' % options['--save-baseline'])
+	if '--baseline' in options:
+		with open(options['--baseline']) as fd:
+			baseline = json.load(fd)
+		regressions = compare(result, baseline, tolerance)
+		for regression in regressions:
+			print('REGRESSION: %s' % regression)
+		if regressions:
+			return 1
+		print('No regressions compared to %s' % options['--baseline'])
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main(sys.argv[1:]))
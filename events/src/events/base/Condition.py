@@ -6,6 +6,13 @@ import time
 from tellduslive.base import LiveMessage
 
 class Condition(object):
+	# Set to True if validate() always calls success or failure before it
+	# returns. These conditions are evaluated directly without callbacks.
+	synchronous = False
+	# Relative cost of validating a synchronous condition. Cheaper conditions
+	# are evaluated first.
+	cost = 1
+
 	# pylint: disable=W0622
 	def __init__(self, event, id, group, **__kwargs):
 		super(Condition, self).__init__()
@@ -13,6 +20,12 @@ class Condition(object):
 		self.id = id  # pylint: disable=C0103
 		self.group = group
 
+	def evaluate(self):
+		"""Validate a synchronous condition, returns True if it is fulfilled"""
+		result = []
+		self.validate(success=lambda: result.append(True), failure=lambda: result.append(False))
+		return result == [True]
+
 	def loadParams(self, params):
 		for param in params:
 			try:
@@ -30,28 +43,61 @@ class Condition(object):
 		failure()
 
 class RemoteCondition(Condition):
+	# Seconds to wait for the server to answer
+	REQUEST_TIMEOUT = 30
+	# Never cache a result longer than this, even if the server allows it
+	MAX_CACHE_TTL = 300
+
 	def __init__(self, **kwargs):
 		super(RemoteCondition, self).__init__(**kwargs)
 		self.outstandingRequests = []
+		self.requestSent = 0
+		self.cachedResult = None
+		self.cachedUntil = 0
 
-	def receivedResultFromServer(self, result):
-		for request in self.outstandingRequests:
-			age = time.time() - request['started']
-			if age > 30:
+	def receivedResultFromServer(self, result, ttl=None):
+		"""
+		Called with the result from the server. If the server sets a ttl the
+		result is reused for that many seconds.
+		"""
+		now = time.time()
+		requests = self.outstandingRequests
+		self.outstandingRequests = []
+		self.requestSent = 0
+		try:
+			ttl = min(float(ttl or 0), RemoteCondition.MAX_CACHE_TTL)
+		except (TypeError, ValueError):
+			ttl = 0
+		if ttl > 0:
+			self.cachedResult = result
+			self.cachedUntil = now + ttl
+		for request in requests:
+			age = now - request['started']
+			if age > RemoteCondition.REQUEST_TIMEOUT:
 				# Too old
 				continue
 			if result == 'success':
 				request['success']()
 			else:
 				request['failure']()
-		self.outstandingRequests = []
 
 	def validate(self, success, failure):
+		now = time.time()
+		if self.cachedResult is not None and now < self.cachedUntil:
+			if self.cachedResult == 'success':
+				success()
+			else:
+				failure()
+			return
 		self.outstandingRequests.append({
-			'started': time.time(),
+			'started': now,
 			'success': success,
 			'failure': failure,
 		})
+		if now - self.requestSent < RemoteCondition.REQUEST_TIMEOUT:
+			# Already waiting for the server, all requests get the same answer
+			return
+		self.requestSent = now
 		msg = LiveMessage('event-validatecondition')
 		msg.append({
 			'condition': self.id
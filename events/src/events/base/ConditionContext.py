@@ -1,6 +1,6 @@
 # -*- coding: utf-8 -*-
 
-from threading import Timer
+from base import Application
 
 class ConditionContext(object):
 	EVALUATING, DONE = range(2)
@@ -11,13 +11,11 @@ class ConditionContext(object):
 		self.success = success
 		self.failure = failure
 		self.kwargs = kwargs
+		self.trace = kwargs.get('trace')
 		self.conditions = []
 		self.state = ConditionContext.EVALUATING
-		for i in conditions:
-			group = []
-			for condition in conditions[i].conditions:
-				group.append(ConditionsEvaluation(self, conditions[i].conditions[condition]))
-			self.conditions.append(group)
+		for group in conditions:
+			self.conditions.append([ConditionsEvaluation(self, condition) for condition in group])
 
 	def evaluate(self):
 		for group in self.conditions:
@@ -51,8 +49,7 @@ class ConditionsEvaluation(object):
 	def evaluate(self):
 		self.state = ConditionsEvaluation.EVALUATING
 		# Start timeout if server doesn't reply
-		self.timeout = Timer(30.0, self.__failure)
-		self.timeout.start()
+		self.timeout = Application().callLater(30.0, self.__failure)
 		self.condition.validate(success=self.__success, failure=self.__failure)
 
 	def __success(self):
@@ -62,6 +59,8 @@ class ConditionsEvaluation(object):
 			self.timeout.cancel()
 			self.timeout = None
 		self.state = ConditionsEvaluation.SUCCESS
+		if self.context.trace is not None:
+			self.context.trace.record('condition', self.condition.id, 'success')
 		self.context.event.manager.live.pushToWeb('event', 'condition', {
 			'event': self.context.event.eventId,
 			'condition': self.condition.id,
@@ -76,6 +75,8 @@ class ConditionsEvaluation(object):
 			self.timeout.cancel()
 			self.timeout = None
 		self.state = ConditionsEvaluation.FAILED
+		if self.context.trace is not None:
+			self.context.trace.record('condition', self.condition.id, 'failure')
 		self.context.event.manager.live.pushToWeb('event', 'condition', {
 			'event': self.context.event.eventId,
 			'condition': self.condition.id,
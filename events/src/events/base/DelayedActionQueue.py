@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+
+import json
+import logging
+import os
+
+class DelayedActionQueue(object):
+	"""
+	Stores the delayed actions waiting to be executed so they can be
+	restarted after a reboot.
+
+	Each change is appended as one line to a journal file so storing a delay
+	does not rewrite the event definitions. The journal is compacted when it
+	contains many replaced or removed entries. All writes are synced to disk
+	so no stored delay is lost on power loss.
+	"""
+
+	# Compact the journal when it has this many lines more than pending actions
+	COMPACT_LIMIT = 100
+
+	def __init__(self, filename):
+		super(DelayedActionQueue, self).__init__()
+		self.filename = filename
+		self.entries = {}
+		self.journalLength = 0
+		self.fd = None
+		self.__load()
+		self.__compact()
+
+	def actions(self, eventId):
+		"""Returns the pending actions for an event, by action id"""
+		return dict([
+			(actionId, entry)
+			for (entryEventId, actionId), entry in self.entries.items()
+			if entryEventId == str(eventId)
+		])
+
+	def add(self, eventId, actionId, delayExecTime, triggerInfo, delay, delayPolicy):
+		key = (str(eventId), str(actionId))
+		self.entries[key] = {
+			'delayExecTime': delayExecTime,
+			'triggerInfo': triggerInfo,
+			'delay': delay,
+			'delayPolicy': delayPolicy,
+		}
+		self.__append(dict(self.entries[key], event=key[0], action=key[1]))
+
+	def close(self):
+		if self.fd is not None:
+			self.fd.close()
+			self.fd = None
+
+	def eventIds(self):
+		return set([eventId for eventId, __actionId in self.entries])
+
+	def remove(self, eventId, actionId):
+		key = (str(eventId), str(actionId))
+		if self.entries.pop(key, None) is None:
+			return
+		self.__append({'event': key[0], 'action': key[1]})
+
+	def removeEvent(self, eventId):
+		"""Remove all pending actions for an event"""
+		for __eventId, actionId in [key for key in self.entries if key[0] == str(eventId)]:
+			self.remove(eventId, actionId)
+
+	def __append(self, entry):
+		if self.journalLength > len(self.entries) + DelayedActionQueue.COMPACT_LIMIT:
+			self.__compact()
+			return
+		try:
+			if self.fd is None:
+				self.fd = open(self.filename, 'a')
+			self.fd.write('%s\n' % json.dumps(entry))
+			self.fd.flush()
+			os.fsync(self.fd.fileno())
+			self.journalLength = self.journalLength + 1
+		except (IOError, OSError) as error:
+			logging.error('Could not store delayed action: %s', error)
+
+	def __compact(self):
+		self.close()
+		try:
+			with open('%s.1' % self.filename, 'w') as fd:
+				for (eventId, actionId), entry in self.entries.items():
+					fd.write('%s\n' % json.dumps(dict(entry, event=eventId, action=actionId)))
+				fd.flush()
+				# The data must be on disk before the rename, else the rename may
+				# be written first and leave an empty journal on power loss
+				os.fsync(fd.fileno())
+			# Rename is atomic, the journal is never left half written
+			os.rename('%s.1' % self.filename, self.filename)
+			self.__syncDirectory()
+			self.journalLength = len(self.entries)
+		except (IOError, OSError) as error:
+			logging.error('Could not store delayed actions: %s', error)
+
+	def __syncDirectory(self):
+		# Make sure the rename is stored
+		dirfd = os.open(os.path.dirname(os.path.abspath(self.filename)), os.O_RDONLY)
+		try:
+			os.fsync(dirfd)
+		finally:
+			os.close(dirfd)
+
+	def __load(self):
+		if not os.path.isfile(self.filename):
+			return
+		with open(self.filename, 'r') as fd:
+			for line in fd:
+				try:
+					entry = json.loads(line)
+					key = (entry.pop('event'), entry.pop('action'))
+				except (ValueError, KeyError, AttributeError):
+					# The last line may be incomplete if we lost power while writing
+					continue
+				if 'delayExecTime' in entry:
+					self.entries[key] = entry
+				else:
+					self.entries.pop(key, None)
@@ -1,5 +1,7 @@
 # -*- coding: utf-8 -*-
 
+import hashlib
+import json
 import logging
 import time
 
@@ -15,9 +17,13 @@ class Event(object):
 		self.eventId = eventId
 		self.minimumRepeatInterval = minimumRepeatInterval
 		self.description = description
+		# Hash of the definition this event was loaded from
+		self.definitionHash = None
 		self.lastRun = None
 		self.actions = {}
 		self.conditions = {}
+		# Condition groups as (synchronous, asynchronous) condition lists
+		self.compiledConditions = []
 		self.triggers = {}
 		self.evaluatingConditions = []
 
@@ -28,12 +34,14 @@ class Event(object):
 		for actionId in self.actions:
 			self.actions[actionId].close()
 
-	def loadActions(self, data, storeddata):
+	@staticmethod
+	def hashDefinition(data):
+		"""Returns a hash of an event definition"""
+		return hashlib.sha1(json.dumps(data, sort_keys=True)).hexdigest()
+
+	def loadActions(self, data):
 		# check for running action delays
-		storedActions = None
-		if str(self.eventId) in storeddata:
-			if 'actions' in storeddata[str(self.eventId)]:
-				storedActions = storeddata[str(self.eventId)]['actions']
+		storedActions = self.manager.delayedActions.actions(self.eventId)
 		for actionId in data:
 			action = self.manager.requestAction(event=self, id=int(actionId), **data[actionId])
 			if not action:
@@ -42,6 +50,10 @@ class Event(object):
 				action.loadParams(data[actionId]['params'])
 			action.compareStoredDelay(storedActions)
 			self.actions[int(actionId)] = action
+		for actionId in storedActions:
+			if actionId not in data:
+				# The action has been removed
+				self.manager.delayedActions.remove(self.eventId, actionId)
 
 	def loadConditions(self, data):
 		for conditionId in data:
@@ -54,6 +66,28 @@ class Event(object):
 			if group not in self.conditions:
 				self.conditions[group] = ConditionGroup()
 			self.conditions[group].addCondition(condition)
+		self.compileConditions()
+
+	def compileConditions(self):
+		"""
+		Split the condition groups into conditions that can be evaluated
+		directly and conditions that must be validated asynchronously, e.g.
+		by the server. Groups with only synchronous conditions are evaluated
+		first and within a group the cheapest conditions are evaluated first.
+		"""
+		self.compiledConditions = []
+		for group in self.conditions.values():
+			conditions = group.conditions.values()
+			syncConditions = sorted(
+				[condition for condition in conditions if condition.synchronous],
+				key=lambda condition: condition.cost
+			)
+			asyncConditions = [condition for condition in conditions if not condition.synchronous]
+			self.compiledConditions.append((syncConditions, asyncConditions))
+		self.compiledConditions.sort(key=lambda group: (
+			len(group[1]) > 0,
+			sum([condition.cost for condition in group[0]])
+		))
 
 	def loadTriggers(self, data):
 		for triggerId in data:
@@ -68,19 +102,31 @@ class Event(object):
 	def execute(self, trigger, triggerInfo=None):
 		triggerInfo = triggerInfo or {}
 		self.manager.live.pushToWeb('event', 'trigger', {'event': self.eventId, 'trigger': trigger.id})
+		trace = self.manager.traceExecution(self.eventId, trigger.id)
 		if (self.lastRun is not None) and (time.time() - self.lastRun < self.minimumRepeatInterval):
+			trace.record('suppressed')
 			return
 		try:
-			if len(self.conditions) == 0:
+			if len(self.compiledConditions) == 0:
 				# No conditions
-				self.__execute(triggerInfo)
-			else:
+				self.__execute(triggerInfo, trace)
+				return
+			asyncGroups = []
+			for syncConditions, asyncConditions in self.compiledConditions:
+				if not self.__evaluateConditions(syncConditions, trace):
+					continue
+				if not asyncConditions:
+					self.__execute(triggerInfo, trace)
+					return
+				asyncGroups.append(asyncConditions)
+			if asyncGroups:
 				conditionContext = ConditionContext(
 					self,
-					self.conditions,
+					asyncGroups,
 					success=self.__execute,
 					failure=self.__failure,
-					triggerInfo=triggerInfo
+					triggerInfo=triggerInfo,
+					trace=trace
 				)
 				self.__cleanContexts()
 				if len(self.evaluatingConditions) == 0:
@@ -96,7 +142,20 @@ class Event(object):
 			x for x in self.evaluatingConditions if x.state is not ConditionContext.DONE
 		]
 
-	def __execute(self, triggerInfo=None):
+	def __evaluateConditions(self, conditions, trace):
+		for condition in conditions:
+			success = condition.evaluate()
+			trace.record('condition', condition.id, 'success' if success else 'failure')
+			self.manager.live.pushToWeb('event', 'condition', {
+				'event': self.eventId,
+				'condition': condition.id,
+				'type': 'success' if success else 'failure'
+			})
+			if not success:
+				return False
+		return True
+
+	def __execute(self, triggerInfo=None, trace=None):
 		triggerInfo = triggerInfo or {}
 		# Clear all pending contexts
 		self.evaluatingConditions = []
@@ -107,7 +166,9 @@ class Event(object):
 		})
 		for actionId in self.actions:
 			try:
-				self.actions[actionId].start(triggerInfo)
+				if trace is not None:
+					trace.record('actionStart', actionId)
+				self.actions[actionId].start(triggerInfo, trace)
 				self.manager.live.pushToWeb('event', 'action', {'event': self.eventId, 'action': actionId})
 			except Exception as error:
 				logging.error("Could not execute action due to: %s", str(error))
@@ -1,8 +1,17 @@
 # -*- coding: utf-8 -*-
 
-from base import Plugin, implements, IInterface, mainthread, ObserverCollection, Settings
+from collections import deque
+import os
+
+from api import IApiCallHandler, apicall
+from base import Application, Plugin, implements, IInterface, mainthread, ObserverCollection, Settings
+from board import Board
 from tellduslive.base import TelldusLive, ITelldusLiveObserver
+from .Condition import RemoteCondition
+from .DelayedActionQueue import DelayedActionQueue
 from .Event import Event
+from .ExecutionTrace import ExecutionTrace
+from .HttpExecutor import HttpExecutor
 from .UrlAction import UrlAction
 
 # pylint: disable=E0211,E0213,W0622
@@ -20,12 +29,24 @@ class IEventFactory(IInterface):
 
 class EventManager(Plugin):
 	implements(ITelldusLiveObserver)
+	implements(IApiCallHandler)
 
 	observers = ObserverCollection(IEventFactory)
 
+	# Number of event executions to keep traces for
+	TRACE_SIZE = 200
+
 	def __init__(self):
 		self.events = {}
+		# Remote conditions by condition id
+		self.remoteConditions = {}
+		# The latest event executions
+		self.traces = deque(maxlen=EventManager.TRACE_SIZE)
 		self.settings = Settings('telldus.event')
+		self.delayedActions = DelayedActionQueue(os.path.join(Board.configDir(), 'DelayedActions.log'))
+		Application().registerShutdown(self.delayedActions.close)
+		self.httpExecutor = HttpExecutor()
+		Application().registerShutdown(self.httpExecutor.stop)
 		self.schedulersettings = Settings('telldus.scheduler')
 		self.live = TelldusLive(self.context)
 		self.timezone = self.schedulersettings.get('tz', 'UTC')
@@ -33,12 +54,65 @@ class EventManager(Plugin):
 		self.longitude = self.schedulersettings.get('longitude', '13.187836')
 		self.loadLocalEvents()
 
-	def loadEvent(self, eventId, data, storeddata):
+	def loadEvent(self, eventId, data):
 		event = Event(self, eventId, data['minRepeatInterval'], data['description'])
-		event.loadActions(data['actions'], storeddata)
+		event.definitionHash = Event.hashDefinition(data)
+		event.loadActions(data['actions'])
 		event.loadConditions(data['conditions'])
 		event.loadTriggers(data['triggers'])
 		self.events[eventId] = event
+		for group in event.conditions.values():
+			for conditionId, condition in group.conditions.items():
+				if isinstance(condition, RemoteCondition):
+					self.remoteConditions[conditionId] = condition
+
+	@apicall('events', 'latency')
+	def eventsLatency(self, **kwargs):
+		"""
+		Returns the time in seconds from a trigger firing until the actions has
+		run, per event. The median (p50) and 95th percentile (p95) are
+		calculated from the executions kept in the trace buffer.
+		"""
+		latencies = {}
+		# Called from the web server thread, copy the traces before iterating
+		for trace in list(self.traces):
+			latency = trace.latency()
+			if latency is not None:
+				latencies.setdefault(str(trace.eventId), []).append(latency)
+		retval = {}
+		for eventId, values in latencies.items():
+			values.sort()
+			retval[eventId] = {
+				'count': len(values),
+				'p50': values[min(len(values)-1, int(len(values)*0.50))],
+				'p95': values[min(len(values)-1, int(len(values)*0.95))],
+			}
+		return retval
+
+	@apicall('events', 'traces')
+	def eventsTraces(self, eventId=None, **kwargs):
+		"""
+		Returns the latest event executions, optionally only for one event. Each
+		execution lists the time of the trigger, each condition result, each
+		action start and device command completion.
+		"""
+		return {
+			'traces': [
+				trace.toDict() for trace in list(self.traces)
+				if eventId is None or str(trace.eventId) == str(eventId)
+			]
+		}
+
+	@apicall('events', 'urlActions')
+	def eventsUrlActions(self, **kwargs):
+		"""
+		Returns the result of the requests made by url actions, per action.
+		Requests are counted as success, failed or dropped (when too many
+		requests were waiting).
+		"""
+		return dict([
+			('%s/%s' % key, stats) for key, stats in self.httpExecutor.metrics().items()
+		])
 
 	def liveRegistered(self, msg):
 		changed = False
@@ -63,9 +137,17 @@ class EventManager(Plugin):
 		if len(self.events) == 0:
 			# only load local events if no report has been received (highly improbable though)
 			data = self.settings.get('events', {})
+			if self.__migrateDelayedActions(data):
+				self.settings['events'] = data
 			for eventId in data:
 				if eventId not in self.events and data[eventId] != "":
-					self.loadEvent(eventId, data[eventId], {})
+					self.loadEvent(eventId, data[eventId])
+
+	def traceExecution(self, eventId, triggerId):
+		"""Start a new trace for an event execution"""
+		trace = ExecutionTrace(eventId, triggerId)
+		self.traces.append(trace)
+		return trace
 
 	def recalcTriggers(self):
 		for observer in self.observers:
@@ -97,24 +179,28 @@ class EventManager(Plugin):
 	@TelldusLive.handler('events-report')
 	def receiveEventsFromServer(self, msg):
 		data = msg.argument(0).toNative()
-		for eventId in self.events:
-			# clear old timers
-			self.events[eventId].close()
-		self.events = {}
-		storeddata = self.settings.get('events', {})
-		self.settings['events'] = data
-		for observer in self.observers:
-			observer.clearAll()
+		# Only reload events that changed, unchanged events keep their trigger
+		# state and pending delays
+		for eventId in list(self.events.keys()):
+			if eventId not in data or self.events[eventId].definitionHash != Event.hashDefinition(data[eventId]):
+				self.__removeEvent(eventId)
+		for eventId in self.delayedActions.eventIds():
+			if eventId not in data:
+				self.delayedActions.removeEvent(eventId)
+		if not self.events:
+			for observer in self.observers:
+				observer.clearAll()
+		if data != self.settings.get('events', {}):
+			self.settings['events'] = data
 		for eventId in data:
 			if eventId not in self.events:
-				self.loadEvent(eventId, data[eventId], storeddata)
+				self.loadEvent(eventId, data[eventId])
 
 	@TelldusLive.handler('one-event-deleted')
 	def receiveDeletedEventFromServer(self, msg):
 		eventId = msg.argument(0).toNative()['eventId']
-		if eventId in self.events:
-			self.events[eventId].close()
-			del self.events[eventId]
+		self.__removeEvent(eventId)
+		self.delayedActions.removeEvent(eventId)
 		storeddata = self.settings.get('events', {})
 		storeddata[str(eventId)] = ""
 		self.settings['events'] = storeddata
@@ -123,27 +209,54 @@ class EventManager(Plugin):
 	def receiveEventFromServer(self, msg):
 		data = msg.argument(0).toNative()
 		eventId = data['eventId']
-		if eventId in self.events:
-			self.events[eventId].close()
-			del self.events[eventId]
+		self.__removeEvent(eventId)
 		storeddata = self.settings.get('events', {})
 		newstoreddata = storeddata.copy()
 		newstoreddata[str(eventId)] = data
 		self.settings['events'] = newstoreddata
-		self.loadEvent(eventId, data, storeddata)
+		self.loadEvent(eventId, data)
 
 	@TelldusLive.handler('event-conditionresult')
 	def receiveConditionResultFromServer(self, msg):
 		data = msg.argument(0).toNative()
-		for eid in self.events:
-			event = self.events[eid]
-			for cgid in event.conditions:
-				conditionGroup = event.conditions[cgid]
-				for cid in conditionGroup.conditions:
-					if cid == data['condition']:
-						try:
-							conditionGroup.conditions[cid].receivedResultFromServer(data['status'])
-						except AttributeError:
-							# Not a RemoteCondition
-							pass
-						return
+		condition = self.remoteConditions.get(data['condition'])
+		if condition is None:
+			return
+		condition.receivedResultFromServer(data['status'], data.get('ttl'))
+
+	def __migrateDelayedActions(self, data):
+		"""
+		Earlier versions stored pending delays in the event definitions. Move
+		them to the delayed action queue. Returns True if the events changed.
+		"""
+		changed = False
+		for eventId, event in data.items():
+			if not isinstance(event, dict):
+				continue  # Deleted event
+			for actionId, action in event.get('actions', {}).items():
+				if 'delayExecTime' not in action and 'triggerInfo' not in action:
+					continue
+				changed = True
+				delayExecTime = action.pop('delayExecTime', None)
+				triggerInfo = action.pop('triggerInfo', None)
+				if not delayExecTime or str(actionId) in self.delayedActions.actions(eventId):
+					continue
+				self.delayedActions.add(
+					eventId,
+					actionId,
+					float(delayExecTime),
+					triggerInfo,
+					action.get('delay'),
+					action.get('delayPolicy')
+				)
+		return changed
+
+	def __removeEvent(self, eventId):
+		if eventId not in self.events:
+			return
+		event = self.events.pop(eventId)
+		event.close()
+		for group in event.conditions.values():
+			for conditionId in group.conditions:
+				if self.remoteConditions.get(conditionId) is group.conditions[conditionId]:
+					del self.remoteConditions[conditionId]
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+
+import time
+
+class ExecutionTrace(object):
+	"""
+	Records what happened during one execution of an event, from the trigger
+	firing until the actions has run. Each record is stored with the number of
+	seconds since the trigger fired.
+
+	Record types:
+
+	``trigger``
+	  The trigger fired.
+	``suppressed``
+	  The event ran too recently (minimum repeat interval) and was not executed.
+	``condition``
+	  A condition was evaluated, the result is ``success`` or ``failure``.
+	``actionStart``
+	  An action was started. Delayed actions runs later.
+	``actionExecute``
+	  An action was executed.
+	``command``
+	  A device command has finished, the result is ``success`` or ``failure``.
+	"""
+
+	def __init__(self, eventId, triggerId):
+		super(ExecutionTrace, self).__init__()
+		self.eventId = eventId
+		self.started = time.time()
+		self.records = []
+		self.record('trigger', triggerId)
+
+	def latency(self):
+		"""
+		Returns the time from the trigger until the last action or device
+		command finished, or None if no action has been executed.
+		"""
+		offsets = [
+			offset for (kind, __id, __result, offset) in self.records
+			if kind in ('actionExecute', 'command')
+		]
+		if not offsets:
+			return None
+		return max(offsets)
+
+	def record(self, kind, id=None, result=None):  # pylint: disable=W0622
+		self.records.append((kind, id, result, time.time() - self.started))
+
+	def toDict(self):
+		return {
+			'event': self.eventId,
+			'started': self.started,
+			'latency': self.latency(),
+			'records': [
+				{'type': kind, 'id': id, 'result': result, 'offset': round(offset, 4)}
+				for (kind, id, result, offset) in self.records
+			],
+		}
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+
+import base64
+from collections import deque
+import httplib
+import logging
+import socket
+from threading import Condition, Lock, Thread
+import time
+import urlparse
+
+class HttpExecutor(object):
+	"""
+	Runs the HTTP requests for url actions on a fixed number of worker
+	threads. Connections are kept open and reused for the next request to the
+	same host.
+
+	At most :py:attr:`MAX_QUEUE` requests are waiting. If a new request is
+	made when the queue is full the oldest waiting request is dropped.
+	"""
+
+	WORKERS = 2
+	MAX_QUEUE = 32
+	CONNECT_TIMEOUT = 5
+	READ_TIMEOUT = 10
+	# Idle connections older than this are closed instead of reused
+	MAX_IDLE = 60
+
+	def __init__(self):
+		super(HttpExecutor, self).__init__()
+		self.queue = deque()
+		self.queueLock = Condition(Lock())
+		# Idle connections by (scheme, host)
+		self.connections = {}
+		self.connectionLock = Lock()
+		self.stats = {}
+		self.statsLock = Lock()
+		self.running = True
+		self.workers = []
+
+	def get(self, key, url):
+		"""
+		Queue a GET request. Key identifies the action the request is made
+		for in the metrics.
+		"""
+		with self.queueLock:
+			if not self.running:
+				return
+			if len(self.queue) >= HttpExecutor.MAX_QUEUE:
+				droppedKey, __url, __queued = self.queue.popleft()
+				logging.warning('Too many url actions waiting, dropping request for %s', droppedKey)
+				self.__updateStats(droppedKey, 'dropped')
+			self.queue.append((key, url, time.time()))
+			if len(self.workers) < HttpExecutor.WORKERS:
+				worker = Thread(target=self.__run, name='UrlAction')
+				worker.daemon = True
+				self.workers.append(worker)
+				worker.start()
+			self.queueLock.notify()
+
+	def metrics(self):
+		"""Returns the request statistics per action"""
+		with self.statsLock:
+			return dict([(key, dict(stats)) for key, stats in self.stats.items()])
+
+	def stop(self):
+		with self.queueLock:
+			self.running = False
+			self.queue.clear()
+			self.queueLock.notifyAll()
+		with self.connectionLock:
+			for connections in self.connections.values():
+				for conn, __lastUsed in connections:
+					conn.close()
+			self.connections = {}
+
+	def __connection(self, scheme, host):
+		with self.connectionLock:
+			connections = self.connections.get((scheme, host), [])
+			while connections:
+				conn, lastUsed = connections.pop()
+				if time.time() - lastUsed < HttpExecutor.MAX_IDLE:
+					return conn, True
+				conn.close()
+		if scheme == 'http':
+			conn = httplib.HTTPConnection(host, timeout=HttpExecutor.CONNECT_TIMEOUT)
+		else:
+			conn = httplib.HTTPSConnection(host, timeout=HttpExecutor.CONNECT_TIMEOUT)
+		return conn, False
+
+	def __execute(self, url):
+		headers = {}
+		url = urlparse.urlparse(url)
+		sendHost = url.netloc  # The port, if any, is part of netloc
+		sendPath = url.path
+		if sendPath == '':
+			sendPath = '/'
+		if url.query != '':
+			sendPath = "%s?%s" % (sendPath, url.query)
+		atIndex = sendHost.find('@')
+		if atIndex >= 0:
+			headers['Authorization'] = 'Basic %s' % (base64.b64encode(sendHost[:atIndex]))
+			sendHost = sendHost[atIndex+1:]
+		while True:
+			conn, reused = self.__connection(url.scheme, sendHost)
+			try:
+				if conn.sock is None:
+					conn.connect()
+				conn.sock.settimeout(HttpExecutor.READ_TIMEOUT)
+				conn.request('GET', sendPath, None, headers)
+				response = conn.getresponse()
+				# The response must be read before the connection can be reused
+				response.read()
+			except (httplib.HTTPException, socket.error):
+				conn.close()
+				if reused:
+					# The server may have closed the idle connection, try a new one
+					continue
+				raise
+			if response.will_close:
+				conn.close()
+			else:
+				with self.connectionLock:
+					self.connections.setdefault((url.scheme, sendHost), []).append((conn, time.time()))
+			return response.status
+
+	def __run(self):
+		while True:
+			with self.queueLock:
+				while self.running and not self.queue:
+					self.queueLock.wait()
+				if not self.running:
+					return
+				key, url, queued = self.queue.popleft()
+			try:
+				status = self.__execute(url)
+			except Exception as error:
+				logging.warning('Url action %s failed: %s', key, error)
+				self.__updateStats(key, 'failed', error=str(error), queued=queued)
+				continue
+			self.__updateStats(key, 'success' if status < 400 else 'failed', status=status, queued=queued)
+
+	def __updateStats(self, key, result, status=None, error=None, queued=None):
+		with self.statsLock:
+			stats = self.stats.setdefault(key, {'success': 0, 'failed': 0, 'dropped': 0})
+			stats[result] = stats[result] + 1
+			if result == 'dropped':
+				return
+			stats['lastStatus'] = status
+			stats['lastError'] = error
+			stats['lastLatency'] = time.time() - queued
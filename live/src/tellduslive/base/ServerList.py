@@ -1,19 +1,32 @@
 # -*- coding: utf-8 -*-
 
-import logging, time
+import logging, random, socket, ssl, threading, time
 from six.moves import http_client
 import netifaces
 import xml.parsers.expat
 from board import Board
 
 class ServerList():
+	LIST_MAX_AGE = 1800  # 30 minutes
+	RANKING_MAX_AGE = 300  # 5 minutes
+	PROBE_TIMEOUT = 5
+	BACKOFF_BASE = 10
+	BACKOFF_MAX = 600
 
-	def __init__(self):
+	def __init__(self, useSSL=True):
 		self.list = []
 		self.listAge = 0
+		self.ranking = []
+		self.rankingAge = 0
+		self.backoff = {}
+		self.useSSL = useSSL
 
 	def popServer(self):
-		if (time.time() - self.listAge) > 1800:  # 30 minutes
+		"""
+		Returns the server with the lowest connect latency that is not currently
+		backing off after a failure. Returns False if no server is available.
+		"""
+		if (time.time() - self.listAge) > ServerList.LIST_MAX_AGE:
 			self.list = []
 		if (self.list == []):
 			try:
@@ -25,10 +38,44 @@ class ServerList():
 		if (self.list == []):
 			return False
 
-		return self.list.pop(0)
+		if self.ranking == [] or (time.time() - self.rankingAge) > ServerList.RANKING_MAX_AGE:
+			self.rankServers()
+
+		now = time.time()
+		for server in self.ranking:
+			if self.backoff.get(ServerList.serverKey(server), {}).get('retryAt', 0) <= now:
+				return server
+		return False
+
+	def rankServers(self):
+		"""Probe all servers concurrently and order them by connect latency"""
+		latencies = {}
+		threads = []
+		for server in self.list:
+			thread = threading.Thread(target=self.__probe, args=(server, latencies), name='ServerProbe')
+			thread.daemon = True
+			thread.start()
+			threads.append(thread)
+		deadline = time.time() + ServerList.PROBE_TIMEOUT + 1
+		for thread in threads:
+			thread.join(max(0, deadline - time.time()))
+		reachable = []
+		unreachable = []
+		for server in self.list:
+			latency = latencies.get(ServerList.serverKey(server))
+			if latency is None:
+				unreachable.append(server)
+				self.serverFailed(server)
+			else:
+				reachable.append((latency, server))
+		reachable.sort(key=lambda x: x[0])
+		self.ranking = [server for (__latency, server) in reachable] + unreachable
+		self.rankingAge = time.time()
+		for latency, server in reachable:
+			logging.info("Server %s:%s latency %.0f ms", server['address'], server['port'], latency*1000)
 
 	def retrieveServerList(self):
-		conn = http_client.HTTPConnection('%s:80' % Board.liveServer())
+		conn = http_client.HTTPConnection('%s:80' % Board.liveServer(), timeout=30)
 		conn.request('GET', "/server/assign?protocolVersion=3&mac=%s" % ServerList.getMacAddr(Board.networkInterface()))
 		response = conn.getresponse()
 
@@ -37,11 +84,67 @@ class ServerList():
 		p.StartElementHandler = self._startElement
 		p.Parse(response.read())
 		self.listAge = time.time()
+		# Force a new probe of the new list
+		self.ranking = []
+
+	def retryDelay(self):
+		"""
+		Returns the number of seconds until the next server leaves its backoff
+		period. If no servers are known a randomized delay is returned.
+		"""
+		if self.list == []:
+			return random.randint(60, 300)
+		now = time.time()
+		retryAt = min([
+			self.backoff.get(ServerList.serverKey(server), {}).get('retryAt', 0) for server in self.list
+		])
+		return max(1, int(retryAt - now))
+
+	def serverConnected(self, server):
+		"""Call this when a connection to the server has been established"""
+		self.backoff.pop(ServerList.serverKey(server), None)
+
+	def serverFailed(self, server):
+		"""
+		Call this when a connection to the server failed or was lost. The server
+		will not be returned again until its backoff period has passed.
+
+		:returns: the backoff period in seconds
+		"""
+		key = ServerList.serverKey(server)
+		failures = self.backoff.get(key, {}).get('failures', 0) + 1
+		delay = min(ServerList.BACKOFF_MAX, ServerList.BACKOFF_BASE * 2**(failures-1))
+		# Add jitter so a whole fleet does not retry the same server at the same time
+		delay = random.uniform(delay/2.0, delay)
+		self.backoff[key] = {'failures': failures, 'retryAt': time.time() + delay}
+		return delay
 
 	def _startElement(self, name, attrs):
 		if (name == 'server'):
 			self.list.append(attrs)
 
+	def __probe(self, server, latencies):
+		port = int(server['port'])
+		if not self.useSSL:
+			port = port + 2
+		start = time.time()
+		try:
+			s = socket.create_connection((server['address'], port), ServerList.PROBE_TIMEOUT)
+			try:
+				if self.useSSL:
+					ctx = ssl.SSLContext(ssl.PROTOCOL_TLSv1)
+					s = ctx.wrap_socket(s)
+			finally:
+				s.close()
+		except Exception as e:
+			logging.warning("Could not probe server %s:%s: %s", server['address'], server['port'], str(e))
+			return
+		latencies[ServerList.serverKey(server)] = time.time() - start
+
+	@staticmethod
+	def serverKey(server):
+		return (server['address'], server['port'])
+
 	@staticmethod
 	def getMacAddr(ifname):
 		addrs = netifaces.ifaddresses(ifname)
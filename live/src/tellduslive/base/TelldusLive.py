@@ -1,6 +1,6 @@
 # -*- coding: utf-8 -*-
 
-import netifaces, time, random
+import netifaces, time
 import threading
 
 from base import Application, Settings, IInterface, ObserverCollection, Plugin, mainthread
@@ -26,12 +26,16 @@ class TelldusLive(Plugin):
 		self.supportedMethods = 0
 		self.connected = False
 		self.registered = False
-		self.serverList = ServerList()
 		Application().registerShutdown(self.stop)
 		self.s = Settings('tellduslive.config')
 		self.uuid = self.s['uuid']
 		self.conn = ServerConnection()
+		self.serverList = ServerList(self.conn.useSSL)
+		self.server = None
 		self.pingTimer = 0
+		self.__handlers = None
+		self.__handlersImplementations = 0
+		self.__unhandledMessages = {}
 		self.thread = threading.Thread(target=self.run)
 		if self.conn.publicKey != '':
 			# Only connect if the keys has been set.
@@ -39,7 +43,8 @@ class TelldusLive(Plugin):
 
 	@mainthread
 	def handleMessage(self, message):
-		if (message.name() == "notregistered"):
+		name = message.name()
+		if (name == "notregistered"):
 			self.email = ''
 			self.connected = True
 			self.registered = False
@@ -49,7 +54,7 @@ class TelldusLive(Plugin):
 			self.observers.liveConnected()
 			return
 
-		if (message.name() == "registered"):
+		if (name == "registered"):
 			self.connected = True
 			self.registered = True
 			data = message.argument(0).toNative()
@@ -58,7 +63,7 @@ class TelldusLive(Plugin):
 			self.observers.liveRegistered(data)
 			return
 
-		if (message.name() == "command"):
+		if (name == "command"):
 			# Extract ACK and handle it
 			args = message.argument(0).dictVal
 			if 'ACK' in args:
@@ -66,21 +71,20 @@ class TelldusLive(Plugin):
 				msg.append(args['ACK'].intVal)
 				self.send(msg)
 
-		if (message.name() == "pong"):
+		elif (name == "pong"):
 			return
 
-		if (message.name() == "disconnect"):
+		elif (name == "disconnect"):
 			self.conn.close()
 			self.__disconnected()
 			return
 
-		handled = False
-		for o in self.observers:
-			for f in getattr(o, '_telldusLiveHandlers', {}).get(message.name(), []):
-				f(o, message)
-				handled = True
-		if not handled:
-			logging.warning("Did not understand: %s", message.toByteArray())
+		handlers = self.__messageHandlers().get(name)
+		if not handlers:
+			self.__unhandledMessage(name, message)
+			return
+		for handler in handlers:
+			handler(message)
 
 	def isConnected(self):
 		return self.connected
@@ -100,16 +104,18 @@ class TelldusLive(Plugin):
 				continue
 			state = self.conn.process()
 			if state == ServerConnection.CLOSED:
-				server = self.serverList.popServer()
-				if not server:
-					wait = random.randint(60, 300)
+				self.server = self.serverList.popServer()
+				if not self.server:
+					wait = self.serverList.retryDelay()
 					logging.warning("No servers found, retry in %i seconds", wait)
 					continue
-				if not self.conn.connect(server['address'], int(server['port'])):
-					wait = random.randint(60, 300)
+				if not self.conn.connect(self.server['address'], int(self.server['port'])):
+					self.serverList.serverFailed(self.server)
+					wait = self.serverList.retryDelay()
 					logging.warning("Could not connect, retry in %i seconds", wait)
 
 			elif state == ServerConnection.CONNECTED:
+				self.serverList.serverConnected(self.server)
 				pongTimer, self.pingTimer = (time.time(), time.time())
 				self.__sendRegisterMessage()
 
@@ -121,14 +127,16 @@ class TelldusLive(Plugin):
 				self.handleMessage(msg)
 
 			elif state == ServerConnection.DISCONNECTED:
-				wait = random.randint(10, 50)
+				# Wait the jittered backoff of the lost server before reconnecting, so a
+				# fleet dropped at once does not reconnect to the next server together
+				wait = max(1, int(self.serverList.serverFailed(self.server)))
 				logging.warning("Disconnected, reconnect in %i seconds", wait)
 				self.__disconnected()
 
 			else:
 				if (time.time() - pongTimer >= 360):  # No pong received
 					self.conn.close()
-					wait = random.randint(10, 50)
+					wait = max(1, int(self.serverList.serverFailed(self.server)))
 					logging.warning("No pong received, disconnecting. Reconnect in %i seconds", wait)
 					self.__disconnected()
 				elif (time.time() - self.pingTimer >= 120):
@@ -159,6 +167,34 @@ class TelldusLive(Plugin):
 		# Syncronize signal with main thread
 		Application().queue(sendNotification)
 
+	def __messageHandlers(self):
+		# The index is rebuilt only when new plugins implementing
+		# ITelldusLiveObserver have been loaded
+		implementations = TelldusLive.observers.implementationCount()
+		if self.__handlers is not None and self.__handlersImplementations == implementations:
+			return self.__handlers
+		handlers = {}
+		for o in self.observers:
+			for name, functions in getattr(o, '_telldusLiveHandlers', {}).items():
+				for f in functions:
+					handlers.setdefault(name, []).append(f.__get__(o, type(o)))
+		self.__handlers = handlers
+		self.__handlersImplementations = implementations
+		return handlers
+
+	def __unhandledMessage(self, name, message):
+		# Rate limit the logging to once a minute for each message name
+		now = time.time()
+		lastLogged, suppressed = self.__unhandledMessages.get(name, (0, 0))
+		if now - lastLogged < 60:
+			self.__unhandledMessages[name] = (lastLogged, suppressed + 1)
+			return
+		self.__unhandledMessages[name] = (now, 0)
+		if suppressed:
+			logging.warning("Did not understand: %s (%i similar suppressed)", message.toByteArray(), suppressed)
+		else:
+			logging.warning("Did not understand: %s", message.toByteArray())
+
 	@staticmethod
 	def handler(message):
 		def call(fn):
@@ -2,7 +2,7 @@
 
 import logging
 import os
-from threading import Thread, Condition, Lock, Timer
+from threading import Thread, Condition, Lock
 import types
 import weakref
 
@@ -93,8 +93,7 @@ class SleepingLuaThread(LuaThread):
 			self.timer.cancel()
 
 	def start(self, callback):
-		self.timer = Timer(self.milliseconds/1000.0, callback)
-		self.timer.start()
+		self.timer = Application().callLater(self.milliseconds/1000.0, callback)
 
 class LuaFunctionWrapper(object):
 	def __init__(self, script, cb):
@@ -1,7 +1,8 @@
 # -*- coding: utf-8 -*-
 
 from base import Application
-import fcntl, os, select, serial, threading, time
+from collections import deque
+import errno, fcntl, os, select, serial, threading, time
 from RF433Msg import RF433Msg
 import logging
 try:
@@ -13,33 +14,70 @@ except ImportError:
 
 class Adapter(threading.Thread):
 	BOOTLOADER_START = 0x7A00
+	MAX_FRAME_LENGTH = 1024
+	# Number of send latencies to keep for the metrics
+	LATENCY_SAMPLES = 100
 
 	def __init__(self, handler, dev):
 		super(Adapter,self).__init__()
 		self.handler = handler
 		self.devUrl = dev
 		self.dev = None
-		self.__queue = []
+		self.__queue = deque()
+		self.__queueLock = threading.Lock()
 		self.__waitForResponse = None
+		self.__latencies = deque(maxlen=Adapter.LATENCY_SAMPLES)
+		self.__stats = {
+			'queued': 0,
+			'sent': 0,
+			'answered': 0,
+			'retries': 0,
+			'timeouts': 0,
+			'deduplicated': 0,
+			'maxQueueDepth': 0,
+		}
 		self.waitingForData = False
 		Application().registerShutdown(self.__stop)
 		(self.readPipe, self.writePipe) = os.pipe()
-		fl = fcntl.fcntl(self.readPipe, fcntl.F_GETFL)
-		fcntl.fcntl(self.readPipe, fcntl.F_SETFL, fl | os.O_NONBLOCK)
+		for fd in (self.readPipe, self.writePipe):
+			fl = fcntl.fcntl(fd, fcntl.F_GETFL)
+			fcntl.fcntl(fd, fcntl.F_SETFL, fl | os.O_NONBLOCK)
 		self.start()
 
+	def metrics(self):
+		"""Returns statistics about the send queue"""
+		with self.__queueLock:
+			retval = dict(self.__stats)
+			retval['queueDepth'] = len(self.__queue)
+			latencies = list(self.__latencies)
+		if latencies:
+			retval['latencyAvg'] = sum(latencies) / len(latencies)
+			retval['latencyMax'] = max(latencies)
+		return retval
+
 	def queue(self, msg):
-		self.__queue.append(msg)
-		if self.waitingForData:
-			# Abort current read
-			os.write(self.writePipe, 'w')
+		"""
+		Queue a message for sending. This may be called from any thread. If an
+		identical message is already waiting to be sent the two are merged and
+		only transmitted once.
+		"""
+		msg.queuedAt = time.time()
+		commandString = msg.commandString()
+		with self.__queueLock:
+			for pending in self.__queue:
+				if pending.commandString() == commandString:
+					pending.merge(msg)
+					self.__stats['deduplicated'] += 1
+					return
+			self.__queue.append(msg)
+			self.__stats['queued'] += 1
+			self.__stats['maxQueueDepth'] = max(self.__stats['maxQueueDepth'], len(self.__queue))
+		self.__wakeup()
 
 	def run(self):
 		self.running = True
 		app = Application()
-		buffer = ''
-		ttl = None
-		state = 0
+		buf = bytearray()
 
 		while self.running:
 			if self.dev is None:
@@ -48,77 +86,128 @@ class Adapter(threading.Thread):
 					self.dev = serial.serial_for_url(self.devUrl, 115200, timeout=0)
 				except Exception as e:
 					self.dev = None
+				buf = bytearray()
 				continue
 
-			if state == 0:
-				x = self.__readByte(interruptable=True)
-				if x == '':
-					if self.__waitForResponse is not None and self.__waitForResponse.queued + 5 < time.time():
-						self.__waitForResponse.timeout()
-						self.__waitForResponse = None
-					if len(self.__queue) and self.__waitForResponse is None:
-						state = 1
-					continue
-				if x == '\r':
-					continue
-				if x == '+':
-					# Start of data
-					buffer = ''
-					continue
-				if x == '\n':
-					(cmd, params) = RF433Msg.parseResponse(buffer)
+			data = self.__read()
+			if data:
+				buf.extend(data)
+				frames = []
+				for frame in Adapter.splitFrames(buf):
+					(cmd, params) = RF433Msg.parseResponse(frame)
 					if cmd is None:
 						continue
 					if self.__waitForResponse is not None:
 						if cmd == self.__waitForResponse.cmd():
-							self.__waitForResponse.response(params)
-							self.__waitForResponse = None
+							self.__responseReceived(params)
 							continue
-					app.queue(self.handler.decodeData, cmd, params)
-					continue
-				buffer = buffer + x
-
-			elif state == 1:
-				if len(self.__queue) == 0:
-					state = 0
-					continue
-				self.__waitForResponse = self.__queue.pop(0)
-				self.__send(self.__waitForResponse.commandString())
-				self.__waitForResponse.queued = time.time()
-				state = 0
+					frames.append((cmd, params))
+				if frames:
+					# Deliver everything from this read to the main thread at once
+					app.queue(self.handler.decodeFrames, frames)
+
+			msg = self.__waitForResponse
+			if msg is not None and msg.sentAt + msg.timeoutValue() < time.time():
+				self.__waitForResponse = None
+				if msg.attempts <= msg.retries:
+					logging.debug('No reply for %s, resending', msg.cmd())
+					with self.__queueLock:
+						self.__stats['retries'] += 1
+					self.__transmit(msg)
+				else:
+					with self.__queueLock:
+						self.__stats['timeouts'] += 1
+					msg.timeout()
+			if self.__waitForResponse is None:
+				with self.__queueLock:
+					msg = self.__queue.popleft() if self.__queue else None
+				if msg is not None:
+					self.__transmit(msg)
+
+	@staticmethod
+	def splitFrames(buf):
+		"""
+		Remove all complete frames from the buffer and return them. A frame
+		starts with + and ends with a newline. Any incomplete frame is kept in
+		the buffer.
+		"""
+		end = buf.rfind('\n')
+		if end < 0:
+			if len(buf) > Adapter.MAX_FRAME_LENGTH:
+				# Garbage or a frame too long, only keep a possible new frame start
+				start = buf.rfind('+')
+				del buf[:start if start >= 0 else len(buf)]
+			return []
+		lines = str(buf[:end]).split('\n')
+		del buf[:end+1]
+		frames = []
+		for line in lines:
+			start = line.rfind('+')
+			if start < 0:
+				continue
+			frames.append(line[start+1:].replace('\r', ''))
+		return frames
+
+	def __responseReceived(self, params):
+		msg = self.__waitForResponse
+		self.__waitForResponse = None
+		with self.__queueLock:
+			self.__stats['answered'] += 1
+			self.__latencies.append(time.time() - msg.sentAt)
+		msg.response(params)
 
 	def __stop(self):
 		self.running = False
-		if self.waitingForData:
-			# Abort current read
-			os.write(self.writePipe, 'w')
+		self.__wakeup()
 
-	def __readByte(self, interruptable = False):
+	def __read(self):
+		"""Wait for data and return all bytes available"""
 		try:
-			if interruptable:
-				self.waitingForData = True
-				i = [self.dev.fileno(), self.readPipe]
-			else:
-				i = [self.dev.fileno()]
-			r, w, e = select.select(i, [], [], 1)
-			if self.dev.fileno() in r:
-				try:
-					return self.dev.read()
-				except serial.SerialException as e:
-					self.dev.close()
-					self.dev = None
-					logging.warning('Serial port lost')
-					logging.exception(e)
-					return ''
-			if self.readPipe in r:
-				try:
-					while True:
-						t = os.read(self.readPipe, 1)
-				except Exception as e:
-					pass
-			return ''
+			self.waitingForData = True
+			r, __w, __e = select.select([self.dev.fileno(), self.readPipe], [], [], 1)
+		except Exception as e:
+			logging.warning('Serial port lost')
+			logging.exception(e)
+			self.dev.close()
+			self.dev = None
+			return None
 		finally:
 			self.waitingForData = False
+		if self.readPipe in r:
+			try:
+				os.read(self.readPipe, 512)
+			except OSError:
+				pass
+		if self.dev.fileno() not in r:
+			return None
+		try:
+			return self.dev.read(4096)
+		except serial.SerialException as e:
+			self.dev.close()
+			self.dev = None
+			logging.warning('Serial port lost')
+			logging.exception(e)
+			return None
 
 	def __send(self, msg):
 		self.dev.write(bytearray(msg))
+
+	def __transmit(self, msg):
+		msg.attempts += 1
+		msg.sentAt = time.time()
+		self.__waitForResponse = msg
+		with self.__queueLock:
+			self.__stats['sent'] += 1
+		try:
+			self.__send(msg.commandString())
+		except Exception as e:
+			# The reply timeout will take care of retrying
+			logging.warning('Could not send to RF433 adapter: %s', str(e))
+
+	def __wakeup(self):
+		"""Abort the current read so the loop can act immediately"""
+		try:
+			os.write(self.writePipe, 'w')
+		except OSError as e:
+			if e.errno != errno.EAGAIN:
+				raise
@@ -0,0 +1,316 @@
+# -*- coding: utf-8 -*-
+
+"""
+Offline benchmark for the 433 MHz receive path.
+
+Replays ``W`` frames, as sent by the RF433 adapter, through
+:py:func:`RF433Msg.parseResponse` and the full decode and device matching
+path in :py:class:`RF433`. No serial device is needed. The plugin is created
+in its own plugin context where the device manager and the Telldus Live!
+connection are stubs, the serial adapter is replaced by a stub as well.
+
+Usage::
+
+  python -m rf433.Benchmark [--devices=N] [--sensors=N] [--passes=N]
+                            [--frames=FILE] [--save-baseline=FILE]
+                            [--baseline=FILE] [--tolerance=PERCENT]
+
+FILE for ``--frames`` is either a capture file written by
+:py:class:`RawCapture` or contains one frame per line in the format received
+from the adapter, e.g. ``+Wclass:sensor;protocol:mandolyn;data:0x...;``.
+
+If a baseline is given, the exit code is 1 when the throughput or the
+latency of any protocol is worse than the baseline by more than the
+tolerance. A reference baseline for the default options is stored in
+``rf433/benchmark-baseline.json``. It was measured on a development
+machine, save a new baseline when comparing on other hardware.
+"""
+
+import getopt
+import json
+import random
+import struct
+import sys
+import time
+
+from base import Application, PluginContext
+from telldus import Device, DeviceManager
+from tellduslive.base import TelldusLive
+
+from .Capture import RawCapture
+from .RF433 import RF433
+from .RF433Msg import RF433Msg
+from .SensorDecoder import SensorDecoder
+
+CRC8_TABLE = SensorDecoder.crc8Table(0x31)
+
+class StubDeviceManager(object):
+	"""Counts the calls made by the RF433 plugin instead of storing anything"""
+	def __init__(self):
+		self.calls = {}
+
+	def __count(self, name):
+		self.calls[name] = self.calls.get(name, 0) + 1
+
+	def addDevice(self, __device):
+		self.__count('addDevice')
+
+	def finishedLoading(self, __deviceType):
+		pass
+
+	def removeDevice(self, __deviceId):
+		self.__count('removeDevice')
+
+	def removeDevices(self, __deviceIds):
+		self.__count('removeDevices')
+
+	@staticmethod
+	def retrieveDevices(__deviceType):
+		return []
+
+	def save(self):
+		self.__count('save')
+
+	def sensorsUpdated(self):
+		self.__count('sensorsUpdated')
+
+	def sensorValueUpdated(self, __device, __valueType, __value, __scale):
+		self.__count('sensorValueUpdated')
+
+	def sensorValuesUpdated(self, __device, __values):
+		self.__count('sensorValuesUpdated')
+
+	def stateUpdated(self, __device, ackId=None, origin=None):  # pylint: disable=W0613
+		self.__count('stateUpdated')
+
+class StubAdapter(object):
+	"""Replaces the serial adapter, nothing is sent"""
+	def __init__(self, __handler, __dev):
+		pass
+
+	def queue(self, __msg):
+		pass
+
+class StubLive(object):
+	def pushToWeb(self, __module, __action, __data):
+		pass
+
+def arctechFrame(house, unit, method):
+	value = (house << 6) | ((1 if method == Device.TURNON else 0) << 4) | (unit - 1)
+	return 'Wclass:command;protocol:arctech;model:selflearning;data:0x%X;' % value
+
+def fineoffsetFrame(sensorId, temperature, humidity):
+	neg = 1 if temperature < 0 else 0
+	value = (sensorId << 20) | (neg << 19) | (int(abs(temperature)*10) << 8) | humidity
+	checksum = 0
+	for byte in struct.pack('>I', value):
+		checksum = CRC8_TABLE[checksum ^ ord(byte)]
+	return 'Wclass:sensor;protocol:fineoffset;data:0x%X;' % ((value << 8) | checksum)
+
+def mandolynFrame(house, channel, temperature, humidity):
+	value = house
+	value = (value << 2) | (channel - 1)
+	value = (value << 3)  # battery ok and two unused bits
+	value = (value << 7) | humidity
+	value = (value << 15) | (int(temperature*128) + 6400)
+	value = (value << 1)
+	return 'Wclass:sensor;protocol:mandolyn;model:temperaturehumidity;data:0x%X;' % value
+
+def oregonFrame(address, channel, temperature):
+	"""Encode a temperature for the Oregon EA4C model (e.g. THC238)"""
+	neg = 1 if temperature < 0 else 0
+	digits = '%04d' % int(round(abs(temperature)*10))
+	hundred, temp1, temp2, temp3 = [int(x) for x in digits]
+	nibbles = [channel, 0, address >> 4, address & 0xF, temp3, 0, temp1, temp2]
+	checksum = 0xE + 0xA + 0x4 + 0xC - 0xA + sum(nibbles) + (neg << 3 | hundred)
+	# The low nibble of the first byte is subtracted 16 times
+	low = checksum // 16
+	checksum = checksum - low*16
+	value = 0
+	for byte in [
+		(nibbles[0] << 4) | nibbles[1],
+		(nibbles[2] << 4) | nibbles[3],
+		(nibbles[4] << 4) | nibbles[5],
+		(nibbles[6] << 4) | nibbles[7],
+		(checksum << 4) | (neg << 3) | hundred,
+		low,
+	]:
+		value = (value << 8) | byte
+	return 'Wclass:sensor;protocol:oregon;model:0xEA4C;data:0x%X;' % value
+
+def generateFrames(devices, sensors, count):
+	"""
+	Generate a realistic mix of frames for the registered devices and sensors.
+	Sensor frames are sent twice, like most sensors do.
+	"""
+	rnd = random.Random(4711)
+	frames = []
+	while len(frames) < count:
+		if rnd.random() < 0.3:
+			house, unit = rnd.choice(devices)
+			frames.append(arctechFrame(house, unit, rnd.choice([Device.TURNON, Device.TURNOFF])))
+			continue
+		protocol, sensorId = rnd.choice(sensors)
+		temperature = round(rnd.uniform(-20, 35), 1)
+		humidity = rnd.randint(10, 90)
+		if protocol == 'fineoffset':
+			frame = fineoffsetFrame(sensorId, temperature, humidity)
+		elif protocol == 'mandolyn':
+			frame = mandolynFrame(sensorId // 10, sensorId % 10, temperature, humidity)
+		else:
+			frame = oregonFrame(sensorId, 1, temperature)
+		frames.extend([frame, frame])
+	return frames[:count]
+
+def readFrames(filename):
+	with open(filename, 'rb') as fd:
+		isCapture = fd.read(len(RawCapture.MAGIC)) == RawCapture.MAGIC
+	if isCapture:
+		return [
+			'W' + payload for (__timestamp, recordType, payload) in RawCapture.read(filename)
+			if recordType == RawCapture.TYPE_RAW
+		]
+	frames = []
+	with open(filename) as fd:
+		for line in fd:
+			line = line.strip()
+			start = line.rfind('+')
+			if start >= 0:
+				line = line[start+1:]
+			if line:
+				frames.append(line)
+	return frames
+
+def setup(deviceCount, sensorCount):
+	Application(run=False)
+	context = PluginContext()
+	context.components[DeviceManager] = StubDeviceManager()
+	context.components[TelldusLive] = StubLive()
+	# The adapter is not a plugin, replace it where RF433 looks it up
+	sys.modules[RF433.__module__].Adapter = StubAdapter
+	rf433 = RF433(context)
+
+	devices = []
+	for i in range(deviceCount):
+		house, unit = 1000 + i // 16, i % 16 + 1
+		rf433.addDevice('arctech', 'selflearning-switch', 'Device %i' % i, {
+			'house': str(house), 'unit': str(unit)
+		})
+		devices.append((house, unit))
+	# Add some codes nobody is listening to
+	devices.extend([(50000 + i, 1) for i in range(max(1, deviceCount // 4))])
+
+	sensors = []
+	for i in range(sensorCount):
+		protocol = ['fineoffset', 'mandolyn', 'oregon'][i % 3]
+		sensorId = {
+			'fineoffset': i % 256,
+			'mandolyn': (i % 16)*10 + (i % 4) + 1,
+			'oregon': i % 256,
+		}[protocol]
+		sensors.append((protocol, sensorId))
+	return rf433, devices, sensors
+
+def protocolForFrame(frame):
+	for part in frame[1:].split(';'):
+		if part.startswith('protocol:'):
+			return part[9:]
+	return 'unknown'
+
+def runPass(rf433, frames, latencies):
+	rf433.recentFrames.clear()
+	start = time.time()
+	for frame in frames:
+		frameStart = time.time()
+		(cmd, params) = RF433Msg.parseResponse(frame)
+		if cmd is not None:
+			rf433.decodeFrames([(cmd, params)])
+		latencies.setdefault(protocolForFrame(frame), []).append(time.time() - frameStart)
+	return time.time() - start
+
+def percentile(values, pct):
+	values = sorted(values)
+	return values[min(len(values)-1, int(len(values)*pct/100.0))]
+
+def report(frameCount, elapsed, latencies, manager):
+	result = {
+		'framesPerSecond': frameCount / elapsed if elapsed > 0 else 0,
+		'protocols': {},
+	}
+	print('Frames: %i in %.3f s, %.0f frames/s' % (frameCount, elapsed, result['framesPerSecond']))
+	print('%-12s %8s %10s %10s %10s' % ('protocol', 'frames', 'mean us', 'p50 us', 'p95 us'))
+	for protocol in sorted(latencies):
+		values = latencies[protocol]
+		mean = sum(values) / len(values) * 1e6
+		result['protocols'][protocol] = mean
+		print('%-12s %8i %10.1f %10.1f %10.1f' % (
+			protocol, len(values), mean, percentile(values, 50)*1e6, percentile(values, 95)*1e6
+		))
+	print('Device manager calls: %s' % ', '.join(
+		['%s=%i' % (name, manager.calls[name]) for name in sorted(manager.calls)]
+	))
+	return result
+
+def compare(result, baseline, tolerance):
+	"""Returns a list of regressions compared to the baseline"""
+	regressions = []
+	limit = 1 + tolerance/100.0
+	if result['framesPerSecond'] * limit < baseline.get('framesPerSecond', 0):
+		regressions.append('throughput %.0f frames/s, baseline %.0f' % (
+			result['framesPerSecond'], baseline['framesPerSecond']
+		))
+	for protocol, mean in result['protocols'].items():
+		baselineMean = baseline.get('protocols', {}).get(protocol)
+		if baselineMean and mean > baselineMean * limit:
+			regressions.append('%s %.1f us, baseline %.1f us' % (protocol, mean, baselineMean))
+	return regressions
+
+def main(argv):
+	opts, __args = getopt.getopt(argv, '', [
+		'devices=', 'sensors=', 'passes=', 'count=', 'frames=',
+		'baseline=', 'save-baseline=', 'tolerance='
+	])
+	options = dict(opts)
+	deviceCount = int(options.get('--devices', 200))
+	sensorCount = int(options.get('--sensors', 60))
+	passes = int(options.get('--passes', 5))
+	tolerance = float(options.get('--tolerance', 20))
+
+	rf433, devices, sensors = setup(deviceCount, sensorCount)
+	if '--frames' in options:
+		frames = readFrames(options['--frames'])
+	else:
+		frames = generateFrames(devices, sensors, int(options.get('--count', 5000)))
+	if not frames:
+		print('No frames to replay')
+		return 2
+	# Let all sensors pass the initial package count before measuring
+	runPass(rf433, frames, {})
+
+	print('Replaying %i frames %i times, %i devices, %i sensors' % (
+		len(frames), passes, deviceCount, sensorCount
+	))
+	latencies = {}
+	elapsed = 0
+	for __i in range(passes):
+		elapsed += runPass(rf433, frames, latencies)
+	result = report(len(frames)*passes, elapsed, latencies, rf433.deviceManager)
+
+	if '--save-baseline' in options:
+		with open(options['--save-baseline'], 'w') as fd:
+			json.dump(result, fd, indent=2, separators=(',', ': '), sort_keys=True)
+			fd.write('\n')
+		print('Baseline saved to %s' % options['--save-baseline'])
+	if '--baseline' in options:
+		with open(options['--baseline']) as fd:
+			baseline = json.load(fd)
+		regressions = compare(result, baseline, tolerance)
+		for regression in regressions:
+			print('REGRESSION: %s' % regression)
+		if regressions:
+			return 1
+		print('No regressions compared to %s' % options['--baseline'])
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main(sys.argv[1:]))
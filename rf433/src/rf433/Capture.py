@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+
+import json
+import logging
+import os
+import struct
+import tempfile
+import time
+
+try:
+	from web.base import Server
+except ImportError:
+	Server = None  # Web interface not available, streaming disabled
+
+class RawCapture(object):
+	"""
+	Records raw and decoded 433 MHz frames to a binary log on local disk and
+	optionally streams them to the local web interface.
+
+	The log is a ring of two segment files. When the active segment reaches
+	half of the maximum size it replaces the previous segment, so at most
+	:py:attr:`MAX_SIZE` bytes are used. Each segment starts with
+	:py:attr:`MAGIC` followed by records:
+
+	  ``>HdB`` payload length, timestamp, record type, then the payload.
+
+	The payload of a raw record is the frame as received from the adapter
+	(without the leading ``+W``), a decoded record contains the decoded data
+	as JSON.
+	"""
+	MAGIC = 'RF433CAP\x01'
+	HEADER = struct.Struct('>HdB')
+	TYPE_RAW = 0
+	TYPE_DECODED = 1
+	MAX_SIZE = 1024*1024
+	# Maximum number of frames per second sent to the websocket
+	STREAM_RATE = 10
+
+	def __init__(self):
+		self.filename = os.path.join(tempfile.gettempdir(), 'rf433-capture.bin')
+		self.recording = False
+		self.streaming = False
+		self.recordFilter = (None, None)
+		self.streamFilter = (None, None)
+		self.streamRate = RawCapture.STREAM_RATE
+		self.streamTokens = 0
+		self.streamLastRefill = 0
+		self.streamDropped = 0
+		self.fd = None
+		self.fdSize = 0
+
+	def active(self):
+		return self.recording or self.streaming
+
+	def raw(self, msg):
+		"""Capture a raw frame, msg is the parsed ``W`` frame from the adapter"""
+		if not self.active():
+			return
+		payload = ';'.join(['%s:%s' % (key, value) for key, value in msg.items()]) + ';'
+		self.__capture(RawCapture.TYPE_RAW, msg, payload)
+
+	def decoded(self, data):
+		"""Capture the result of decoding a frame"""
+		if not self.active():
+			return
+		try:
+			payload = json.dumps(data, separators=(',', ':'))
+		except Exception as __error:
+			return
+		self.__capture(RawCapture.TYPE_DECODED, data, payload)
+
+	def startRecording(self, protocols=None, models=None, filename=None):
+		"""
+		Start writing frames to the capture file. If protocols or models are
+		set only frames matching these are recorded.
+		"""
+		self.stopRecording()
+		if filename is not None:
+			self.filename = filename
+		self.recordFilter = (RawCapture.__filterSet(protocols), RawCapture.__filterSet(models))
+		try:
+			self.fd = open(self.filename, 'ab')
+			self.fdSize = self.fd.tell()
+			if self.fdSize == 0:
+				self.fd.write(RawCapture.MAGIC)
+				self.fdSize = len(RawCapture.MAGIC)
+		except IOError as error:
+			logging.error('Could not open capture file %s: %s', self.filename, str(error))
+			self.fd = None
+			return False
+		self.recording = True
+		logging.info('Recording 433 MHz frames to %s', self.filename)
+		return True
+
+	def stopRecording(self):
+		self.recording = False
+		if self.fd is not None:
+			self.fd.close()
+			self.fd = None
+
+	def startStreaming(self, protocols=None, models=None, rate=None):
+		"""Start streaming frames to the websocket, at most rate frames per second"""
+		if Server is None:
+			logging.warning('Web interface not available, cannot stream 433 MHz frames')
+			return False
+		self.streamFilter = (RawCapture.__filterSet(protocols), RawCapture.__filterSet(models))
+		self.streamRate = rate or RawCapture.STREAM_RATE
+		self.streamTokens = self.streamRate
+		self.streamLastRefill = time.time()
+		self.streamDropped = 0
+		self.streaming = True
+		return True
+
+	def stopStreaming(self):
+		self.streaming = False
+
+	@staticmethod
+	def read(filename):
+		"""
+		Read a capture file and return a list of tuples (timestamp, type,
+		payload), oldest first. The previous segment is included if it exists.
+		"""
+		records = []
+		for path in [filename + '.1', filename]:
+			if not os.path.exists(path):
+				continue
+			with open(path, 'rb') as fd:
+				data = fd.read()
+			if not data.startswith(RawCapture.MAGIC):
+				logging.warning('%s is not a capture file', path)
+				continue
+			offset = len(RawCapture.MAGIC)
+			while offset + RawCapture.HEADER.size <= len(data):
+				length, timestamp, recordType = RawCapture.HEADER.unpack_from(data, offset)
+				offset += RawCapture.HEADER.size
+				if offset + length > len(data):
+					break  # Truncated record
+				records.append((timestamp, recordType, data[offset:offset+length]))
+				offset += length
+		return records
+
+	def __capture(self, recordType, data, payload):
+		now = time.time()
+		if self.recording and RawCapture.__matches(self.recordFilter, data):
+			self.__write(recordType, now, payload)
+		if self.streaming and RawCapture.__matches(self.streamFilter, data):
+			self.__stream(recordType, now, data)
+
+	def __rotate(self):
+		self.fd.close()
+		os.rename(self.filename, self.filename + '.1')
+		self.fd = open(self.filename, 'ab')
+		self.fd.write(RawCapture.MAGIC)
+		self.fdSize = len(RawCapture.MAGIC)
+
+	def __stream(self, recordType, timestamp, data):
+		# Token bucket, refilled with streamRate tokens per second
+		self.streamTokens = min(
+			self.streamRate,
+			self.streamTokens + (timestamp - self.streamLastRefill) * self.streamRate
+		)
+		self.streamLastRefill = timestamp
+		if self.streamTokens < 1:
+			self.streamDropped += 1
+			return
+		self.streamTokens -= 1
+		Server.webSocketSend('rf433', 'capture', {
+			'time': timestamp,
+			'type': 'raw' if recordType == RawCapture.TYPE_RAW else 'decoded',
+			'data': data,
+			'dropped': self.streamDropped,
+		})
+		self.streamDropped = 0
+
+	def __write(self, recordType, timestamp, payload):
+		payload = payload[:0xFFFF]
+		try:
+			if self.fdSize + RawCapture.HEADER.size + len(payload) > RawCapture.MAX_SIZE / 2:
+				self.__rotate()
+			self.fd.write(RawCapture.HEADER.pack(len(payload), timestamp, recordType))
+			self.fd.write(payload)
+			self.fd.flush()
+			self.fdSize += RawCapture.HEADER.size + len(payload)
+		except (IOError, OSError) as error:
+			logging.error('Could not write capture file, stop recording: %s', str(error))
+			self.stopRecording()
+
+	@staticmethod
+	def __filterSet(values):
+		if not values:
+			return None
+		if not isinstance(values, list):
+			values = [values]
+		return set([str(value) for value in values])
+
+	@staticmethod
+	def __matches(captureFilter, msg):
+		protocols, models = captureFilter
+		if protocols is not None and str(msg.get('protocol')) not in protocols:
+			return False
+		if models is not None and str(msg.get('model')) not in models:
+			return False
+		return True
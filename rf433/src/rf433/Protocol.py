@@ -1,8 +1,16 @@
 # -*- coding: utf-8 -*-
 
+from collections import OrderedDict
 from telldus import Device
 
 class Protocol(object):
+	protocols = {}
+	decoders = {}
+	modelInfoCache = {}
+	# Encoded transmissions, least recently used first
+	encodeCache = OrderedDict()
+	ENCODE_CACHE_SIZE = 256
+
 	def __init__(self):
 		self.parameters = {}
 		self.protocol = ''
@@ -76,105 +84,121 @@ class Protocol(object):
 		if 'protocol' not in data:
 			return []
 		retval = []
-		if data['protocol'] == 'arctech':
-			decoded = ProtocolArctech.decodeData(data)
-			if decoded is not None:
-				retval.append(decoded)
-				if decoded['method'] == Device.TURNON:
-					decodedBell = decoded.copy()
-					decodedBell['model'] = 'selflearning-bell'
-					decodedBell['method'] = Device.BELL
-					retval.append(decodedBell)
-			decoded = ProtocolComen.decodeData(data)
-			if decoded is not None:
-				retval.append(decoded)
-			decoded = ProtocolSartano.decodeData(data)
-			if decoded is not None:
-				retval.append(decoded)
+		for decoder in Protocol.decoders.get(data['protocol'], []):
+			decoded = decoder(data)
+			if decoded is None:
+				continue
+			retval.append(decoded)
+			if decoded['protocol'] == 'arctech' and decoded['method'] == Device.TURNON:
+				decodedBell = decoded.copy()
+				decodedBell['model'] = 'selflearning-bell'
+				decodedBell['method'] = Device.BELL
+				retval.append(decodedBell)
 		return retval
 
 	@staticmethod
 	def stringForMethod(__method, __level=None):
 		return None
 
+	@staticmethod
+	def deviceTypeForModel(protocol, model):
+		"""Returns the device type for a protocol and model, cached"""
+		return Protocol.__modelInfo(protocol, model)['deviceType']
+
+	@staticmethod
+	def encodeMethod(protocol, model, parameters, method, level=None):
+		"""
+		Returns the encoded transmission for a method, or None if it could not
+		be encoded. Recently used transmissions are cached so resending the same
+		code does not need to build the pulse train again. The returned dict is
+		shared and must not be modified.
+		"""
+		try:
+			key = (protocol, model, tuple(sorted(parameters.items())), method, level)
+			hash(key)
+		except TypeError:
+			key = None
+		if key is not None and key in Protocol.encodeCache:
+			msg = Protocol.encodeCache.pop(key)
+			Protocol.encodeCache[key] = msg
+			return msg
+		instance = Protocol.protocolInstance(protocol)
+		if not instance:
+			return None
+		instance.setModel(model)
+		instance.setParameters(parameters)
+		msg = instance.stringForMethod(method, level)
+		if key is not None:
+			Protocol.encodeCache[key] = msg
+			while len(Protocol.encodeCache) > Protocol.ENCODE_CACHE_SIZE:
+				Protocol.encodeCache.popitem(last=False)
+		return msg
+
+	@staticmethod
+	def methodsForModel(protocol, model):
+		"""Returns the methods a device with this protocol and model supports, cached"""
+		return Protocol.__modelInfo(protocol, model)['methods']
+
 	@staticmethod
 	def methodsForProtocol(protocol, model):
-		if (protocol == 'arctech'):
-			if (model == 'codeswitch'):
-				return Device.TURNON | Device.TURNOFF
-			if (model == 'selflearning'):
-				return Device.TURNON | Device.TURNOFF
-			if (model == 'selflearning-bell'):
-				return Device.BELL
-		if (protocol == 'comen'):
-			return Device.TURNON | Device.TURNOFF
-		if (protocol == 'everflourish'):
-			return Device.TURNON | Device.TURNOFF
-		if (protocol == 'sartano'):
-			return Device.TURNON | Device.TURNOFF
-		if (protocol == 'waveman'):
-			return Device.TURNON | Device.TURNOFF
-		if (protocol == 'x10'):
-			return Device.TURNON | Device.TURNOFF
-		if (protocol == 'hasta'):
-			return Device.UP | Device.DOWN | Device.STOP
-		return 0
+		"""Returns the methods that can be decoded from received data for this protocol"""
+		methods = Protocol.protocols.get(protocol, {}).get('receivedMethods', 0)
+		if isinstance(methods, dict):
+			return methods.get(model, 0)
+		return methods
 
 	@staticmethod
 	def parametersForProtocol(protocol, __model):
-		if (protocol == 'arctech' or protocol == 'waveman' or protocol == 'comen'):
-			return ['house', 'unit']
-		if (protocol == 'everflourish'):
-			return ['house', 'unit']
-		if (protocol == 'fuhaote'):
-			return ['code']
-		if (protocol == 'sartano'):
-			return ['code']
-		if (protocol == 'x10'):
-			return ['house', 'unit']
-		if (protocol == 'hasta'):
-			return ['house', 'unit']
-		return []
+		"""Returns the parameters identifying a device when matching received data"""
+		return Protocol.protocols.get(protocol, {}).get('parameters', [])
 
 	@staticmethod
 	def protocolInstance(protocol):
-		if (protocol == 'arctech'):
-			return ProtocolArctech()
-		if (protocol == 'brateck'):
-			return ProtocolBrateck()
-		if (protocol == 'comen'):
-			return ProtocolComen()
-		if (protocol == 'everflourish'):
-			return ProtocolEverflourish()
-		if (protocol == 'fuhaote'):
-			return ProtocolFuhaote()
-		if (protocol == 'fineoffset'):
-			return ProtocolFineoffset()
-		if (protocol == 'hasta'):
-			return ProtocolHasta()
-		if (protocol == 'ikea'):
-			return ProtocolIkea()
-		if (protocol == 'kangtai'):
-			return ProtocolKangtai()
-		if (protocol == 'mandolyn'):
-			return ProtocolMandolyn()
-		if (protocol == 'oregon'):
-			return ProtocolOregon()
-		if (protocol == 'risingsun'):
-			return ProtocolRisingSun()
-		if (protocol == 'sartano'):
-			return ProtocolSartano()
-		if (protocol == 'silvanchip'):
-			return ProtocolSilvanChip()
-		if (protocol == 'upm'):
-			return ProtocolUpm()
-		if (protocol == 'waveman'):
-			return ProtocolWaveman()
-		if (protocol == 'x10'):
-			return ProtocolX10()
-		if (protocol == 'yidong'):
-			return ProtocolYidong()
-		return None
+		if protocol not in Protocol.protocols:
+			return None
+		return Protocol.protocols[protocol]['class']()
+
+	@staticmethod
+	def registerProtocol(name, protocolClass, receivedMethods=0, parameters=None, decodes=None):
+		"""
+		Register a protocol implementation. This can be used by plugins to add
+		support for new protocols.
+
+		:param str name: The protocol name, as stored in the device parameters
+		:param class protocolClass: The class encoding (and decoding) the protocol
+		:param receivedMethods: The methods that can be decoded from received data.
+		  Either an integer or a dictionary with one integer per model.
+		:param list parameters: The parameters identifying a device in received data
+		:param str decodes: If set, `protocolClass.decodeData()` will be called
+		  for all incoming command data with this raw protocol name
+		"""
+		Protocol.protocols[name] = {
+			'class': protocolClass,
+			'receivedMethods': receivedMethods,
+			'parameters': parameters or [],
+		}
+		if decodes is not None:
+			Protocol.decoders.setdefault(decodes, []).append(protocolClass.decodeData)
+		# Invalidate any cached model info for this protocol
+		for key in [key for key in Protocol.modelInfoCache if key[0] == name]:
+			del Protocol.modelInfoCache[key]
+		for key in [key for key in Protocol.encodeCache if key[0] == name]:
+			del Protocol.encodeCache[key]
+
+	@staticmethod
+	def __modelInfo(protocol, model):
+		key = (protocol, model)
+		info = Protocol.modelInfoCache.get(key)
+		if info is not None:
+			return info
+		instance = Protocol.protocolInstance(protocol)
+		if not instance:
+			info = {'methods': 0, 'deviceType': Device.TYPE_SWITCH_OUTLET}
+		else:
+			instance.setModel(model)
+			info = {'methods': instance.methods(), 'deviceType': instance.deviceType()}
+		Protocol.modelInfoCache[key] = info
+		return info
 
 # pylint: disable=C0413
 from .ProtocolArctech import ProtocolArctech
@@ -195,3 +219,27 @@ from .ProtocolUpm import ProtocolUpm
 from .ProtocolWaveman import ProtocolWaveman
 from .ProtocolX10 import ProtocolX10
 from .ProtocolYidong import ProtocolYidong
+
+# pylint: disable=C0301
+Protocol.registerProtocol('arctech', ProtocolArctech, receivedMethods={
+	'codeswitch': Device.TURNON | Device.TURNOFF,
+	'selflearning': Device.TURNON | Device.TURNOFF,
+	'selflearning-bell': Device.BELL,
+}, parameters=['house', 'unit'], decodes='arctech')
+Protocol.registerProtocol('brateck', ProtocolBrateck)
+Protocol.registerProtocol('comen', ProtocolComen, receivedMethods=Device.TURNON | Device.TURNOFF, parameters=['house', 'unit'], decodes='arctech')
+Protocol.registerProtocol('everflourish', ProtocolEverflourish, receivedMethods=Device.TURNON | Device.TURNOFF, parameters=['house', 'unit'])
+Protocol.registerProtocol('fineoffset', ProtocolFineoffset)
+Protocol.registerProtocol('fuhaote', ProtocolFuhaote, parameters=['code'])
+Protocol.registerProtocol('hasta', ProtocolHasta, receivedMethods=Device.UP | Device.DOWN | Device.STOP, parameters=['house', 'unit'])
+Protocol.registerProtocol('ikea', ProtocolIkea)
+Protocol.registerProtocol('kangtai', ProtocolKangtai)
+Protocol.registerProtocol('mandolyn', ProtocolMandolyn)
+Protocol.registerProtocol('oregon', ProtocolOregon)
+Protocol.registerProtocol('risingsun', ProtocolRisingSun)
+Protocol.registerProtocol('sartano', ProtocolSartano, receivedMethods=Device.TURNON | Device.TURNOFF, parameters=['code'], decodes='arctech')
+Protocol.registerProtocol('silvanchip', ProtocolSilvanChip)
+Protocol.registerProtocol('upm', ProtocolUpm)
+Protocol.registerProtocol('waveman', ProtocolWaveman, receivedMethods=Device.TURNON | Device.TURNOFF, parameters=['house', 'unit'])
+Protocol.registerProtocol('x10', ProtocolX10, receivedMethods=Device.TURNON | Device.TURNOFF, parameters=['house', 'unit'])
+Protocol.registerProtocol('yidong', ProtocolYidong)
@@ -1,53 +1,53 @@
 # -*- coding: utf-8 -*-
 
 from telldus import Device
-import crcmod.predefined
-import struct
+from .SensorDecoder import SensorDecoder
 import logging
 
+def layout(model, values, humidityRange):
+	return {
+		'fields': [
+			('id', {'bits': (28, 8)}),
+			('temperature', {'bits': (16, 11), 'divide': 10.0, 'signBit': 27}),
+			('humidity', {'bits': (8, 8)}),
+		],
+		'checksum': {'crc8': 0x131, 'bits': (8, 32), 'target': (0, 8)},
+		'require': [('humidity',) + humidityRange],
+		'id': 'id',
+		'values': values,
+		'model': model,
+	}
+
 class ProtocolFineoffset():
+	# The humidity byte tells which model sent the data, try them in order
+	decoders = [
+		SensorDecoder(layout('temperaturehumidity', [
+			(Device.TEMPERATURE, Device.SCALE_TEMPERATURE_CELCIUS, 'temperature'),
+			(Device.HUMIDITY, Device.SCALE_HUMIDITY_PERCENT, 'humidity'),
+		], (0, 100))),
+		SensorDecoder(layout('temperature', [
+			(Device.TEMPERATURE, Device.SCALE_TEMPERATURE_CELCIUS, 'temperature'),
+		], (0xFF, 0xFF))),
+	]
+
 	def __init__(self):
 		pass
 
-	def calculateChecksum(self, data):
-		crc_8_func = crcmod.mkCrcFun(0x131, rev=False, initCrc=0x00)
-		data = struct.pack('>I', data)
-		return crc_8_func(data)
-
 	def decodeData(self, data):
 		if 'data' not in data:
 			return None
 		value = int(data['data'], 16)
 
-		checksum = value & 0xFF
-		value >>= 8
-
-		if checksum != self.calculateChecksum(value):
-			logging.warning("Wrong checksum for fineoffset, %i" % value)
-			return None
-
-		humidity = value & 0xFF
-		value >>= 8
-
-		temperature = (value & 0x7FF)/10.0
-		value >>= 11
-
-		if value & 0x1: #Negative
-			temperature = -temperature
-		value >>= 1
-
-		id = value & 0xFF
-
-		data['id'] = int(id)
-		valueList = []
-		valueList.append({'type': Device.TEMPERATURE, 'value': temperature, 'scale': Device.SCALE_TEMPERATURE_CELCIUS})
-		if humidity <= 100:
-			valueList.append({'type': Device.HUMIDITY, 'value': humidity, 'scale': Device.SCALE_HUMIDITY_PERCENT})
-			data['model'] = 'temperaturehumidity'
-		elif humidity == 0xFF:
-			data['model'] = 'temperature'
+		for decoder in ProtocolFineoffset.decoders:
+			msg = decoder.decode(value)
+			if msg is not None:
+				break
 		else:
+			if not ProtocolFineoffset.decoders[0].checksumValid(value):
+				logging.warning("Wrong checksum for fineoffset, %i" % (value >> 8))
 			return None
-		data['values'] = valueList
 
+		data['id'] = msg['id']
+		data['model'] = msg['model']
+		data['values'] = msg['values']
 		return data
@@ -1,39 +1,35 @@
 # -*- coding: utf-8 -*-
 
-import logging
 from telldus import Device
+from .SensorDecoder import SensorDecoder
 
 class ProtocolMandolyn():
+	decoder = SensorDecoder({
+		'fields': [
+			('temperature', {'bits': (1, 15), 'add': -6400, 'divide': 128.0, 'round': 1}),
+			('humidity', {'bits': (16, 7)}),
+			('battery', {'bits': (23, 1)}),
+			('channel', {'bits': (26, 2), 'add': 1}),
+			('house', {'bits': (28, 4)}),
+			('id', {'fields': [('house', 10), ('channel', 1)]}),
+		],
+		'id': 'id',
+		'battery': 'battery',
+		'values': [
+			(Device.TEMPERATURE, Device.SCALE_TEMPERATURE_CELCIUS, 'temperature'),
+			(Device.HUMIDITY, Device.SCALE_HUMIDITY_PERCENT, 'humidity'),
+		],
+	})
+
 	def __init__(self):
 		pass
 
 	def decodeData(self, data):
 		if 'data' not in data:
 			return None
-		value = int(data['data'], 16)
-
-		parity = value & 0x1
-		value >>= 1
-
-		temp = (value & 0x7FFF) - 6400
-		temp = round(temp/128.0,1)
-		value >>= 15
-
-		humidity = (value & 0x7F)
-		value >>= 7
-
-		battOk = value & 0x1
-		value >>= 3
-
-		channel = (value & 0x3)+1
-		value >>= 2
-
-		house = value & 0xF
+		msg = ProtocolMandolyn.decoder.decode(int(data['data'], 16))
 
-		data['id'] = int(house*10+channel)
-		valueList = []
-		valueList.append({'type': Device.TEMPERATURE, 'value': temp, 'scale': Device.SCALE_TEMPERATURE_CELCIUS})
-		valueList.append({'type': Device.HUMIDITY, 'value': humidity, 'scale': Device.SCALE_HUMIDITY_PERCENT})
-		data['values'] = valueList
-		data['battery'] = Device.BATTERY_LOW if battOk == 1 else Device.BATTERY_OK
+		data['id'] = msg['id']
+		data['values'] = msg['values']
+		data['battery'] = msg['battery']
 		return data
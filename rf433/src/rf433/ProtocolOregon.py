@@ -1,387 +1,185 @@
 # -*- coding: utf-8 -*-
 
-import logging
 from telldus import Device
+from .SensorDecoder import SensorDecoder
+
+# Nibble layouts for the supported models. Nibble 0 is the least significant
+# nibble of the received data. Protocol version 3 models use the sum of the
+# two rolling code nibbles as id.
+LAYOUTS = {
+	0xEA4C: {
+		'fields': [
+			('address', {'nibbles': [9, 8]}),
+			('temperature', {'bcd': [(2, 0x3), 5, 4, 7], 'decimals': 1, 'sign': (2, 0x8)}),
+			('battery', {'nibbles': [(6, 0x4)]}),
+		],
+		'checksum': {
+			'sum': [(0, -0x10), 2, 4, 5, 6, 7, 8, 9, 10, 11],
+			'offset': 0xE + 0xA + 0x4 + 0xC - 0xA,
+			'mask': None,
+			'target': [3],
+		},
+		'id': 'address',
+		'battery': 'battery',
+		'values': [
+			(Device.TEMPERATURE, Device.SCALE_TEMPERATURE_CELCIUS, 'temperature'),
+		],
+	},
+	0x1A2D: {
+		'fields': [
+			('address', {'nibbles': [13, 12]}),
+			('temperature', {'bcd': [9, 8, 11], 'decimals': 1, 'sign': (6, 0x8)}),
+			('humidity', {'bcd': [4, 7]}),
+			('battery', {'nibbles': [(10, 0x4)]}),
+		],
+		# TODO: Find out how the second checksum byte works
+		'checksum': {
+			'sum': range(4, 16),
+			'offset': 0x1 + 0xA + 0x2 + 0xD - 0xA,
+			'mask': None,
+			'target': [3, 2],
+		},
+		'id': 'address',
+		'battery': 'battery',
+		'values': [
+			(Device.TEMPERATURE, Device.SCALE_TEMPERATURE_CELCIUS, 'temperature'),
+			(Device.HUMIDITY, Device.SCALE_HUMIDITY_PERCENT, 'humidity'),
+		],
+	},
+	# Protocol version 3, e.g. THGR810
+	0xF824: {
+		'fields': [
+			('rollingcode', {'nibbleSum': [11, 12]}),
+			('temperature', {'bcd': [7, 8, 9], 'decimals': 1, 'sign': (6, 0xF)}),
+			('humidity', {'bcd': [4, 5]}),
+		],
+		'checksum': {
+			'sum': range(3, 14),
+			'offset': 0xF + 0x8 + 0x2 + 0x4,
+			'mask': 0xFF,
+			'target': [1, 2],
+		},
+		'id': 'rollingcode',
+		'values': [
+			(Device.TEMPERATURE, Device.SCALE_TEMPERATURE_CELCIUS, 'temperature'),
+			(Device.HUMIDITY, Device.SCALE_HUMIDITY_PERCENT, 'humidity'),
+		],
+	},
+	# Protocol version 3, rain
+	0x2914: {
+		'fields': [
+			('rollingcode', {'nibbleSum': [13, 14]}),
+			# Reported in inches, converted to mm
+			('rainTotal', {'bcd': [2, 3, 4, 5, 6, 7], 'decimals': 3, 'factor': 25.4, 'round': 1}),
+			('rainRate', {'bcd': [8, 9, 10, 11], 'decimals': 2, 'factor': 25.4, 'round': 1}),
+			('battery', {'nibbles': [(12, 0x4)]}),
+		],
+		'checksum': {
+			'sum': range(2, 16),
+			'offset': 0x2 + 0x9 + 0x1 + 0x4,
+			'mask': 0xFF,
+			'target': [0, 1],
+		},
+		'id': 'rollingcode',
+		'battery': 'battery',
+		'values': [
+			(Device.RAINRATE, Device.SCALE_RAINRATE_MMH, 'rainRate'),
+			(Device.RAINTOTAL, Device.SCALE_RAINTOTAL_MM, 'rainTotal'),
+		],
+	},
+	# Protocol version 3, UV index
+	0xD874: {
+		'fields': [
+			('rollingcode', {'nibbleSum': [7, 8]}),
+			('uv', {'bcd': [4, 5]}),
+			('battery', {'nibbles': [(6, 0x4)]}),
+		],
+		# TODO: Only the low nibble of the checksum seems to match
+		'checksum': {
+			'sum': range(2, 10),
+			'offset': 0xD + 0x8 + 0x7 + 0x4,
+			'mask': 0xF,
+			'target': [0],
+		},
+		'id': 'rollingcode',
+		'battery': 'battery',
+		'values': [
+			(Device.UV, Device.SCALE_UV_INDEX, 'uv'),
+		],
+	},
+}
+
+def windLayout(checksumOffset):
+	# Protocol version 3, wind
+	return {
+		'fields': [
+			('rollingcode', {'nibbleSum': [13, 14]}),
+			('direction', {'nibbles': [11], 'factor': 22.5}),
+			('average', {'bcd': [3, 4, 5], 'decimals': 1}),
+			('gust', {'bcd': [6, 7, 8], 'decimals': 1}),
+			('battery', {'nibbles': [(12, 0x4)]}),
+		],
+		'checksum': {
+			'sum': range(3, 16),
+			'offset': checksumOffset,
+			'mask': 0xFF,
+			'target': [1, 2],
+		},
+		'id': 'rollingcode',
+		'battery': 'battery',
+		'values': [
+			(Device.WINDDIRECTION, Device.SCALE_WIND_DIRECTION, 'direction'),
+			(Device.WINDAVERAGE, Device.SCALE_WIND_VELOCITY_MS, 'average'),
+			(Device.WINDGUST, Device.SCALE_WIND_VELOCITY_MS, 'gust'),
+		],
+	}
+
+def temperatureLayout(checksumOffset):
+	# Protocol version 3, pool thermometer
+	return {
+		'fields': [
+			('rollingcode', {'nibbleSum': [7, 8]}),
+			('temperature', {'bcd': [3, 4, 5], 'decimals': 1, 'sign': (2, 0xF)}),
+		],
+		'checksum': {
+			'sum': range(2, 10),
+			'offset': checksumOffset,
+			'mask': 0xFF,
+			'target': [0, 1],
+		},
+		'id': 'rollingcode',
+		'values': [
+			(Device.TEMPERATURE, Device.SCALE_TEMPERATURE_CELCIUS, 'temperature'),
+		],
+	}
+
+LAYOUTS[0x1984] = windLayout(0x1 + 0x9 + 0x8 + 0x4)
+LAYOUTS[0x1994] = windLayout(0x1 + 0x9 + 0x9 + 0x4)
+LAYOUTS[0xC844] = temperatureLayout(0xC + 0x8 + 0x4 + 0x4)
+LAYOUTS[0xEC40] = temperatureLayout(0xE + 0xC + 0x4 + 0x0)  # Not yet tested
 
 class ProtocolOregon():
+	# Compiled decoders and the model name reported, by model id
+	models = dict([
+		(model, (SensorDecoder(layout), '%X' % model)) for model, layout in LAYOUTS.items()
+	])
+
 	def __init__(self):
 		pass
 
 	def decodeData(self, data):
 		if 'data' not in data or 'model' not in data:
 			return None
-		msg = None
-		value = int(data['data'], 16)
-		model = int(data['model'], 16)
-
-		if model == 0xEA4C:
-			msg = self.decodeEA4C(value)
-		elif model == 0x1A2D:
-			msg = self.decode1A2D(value)
-		elif model == 0xF824:
-			# protocol version 3, e.g. THGR810
-			msg = self.decodeF824(value)
-		elif model == 0x1984 or model == 0x1994:
-			# protocol version 3, wind
-			msg = self.decode1984(value, model)
-		elif model == 0x2914:
-			# protocol version 3, rain
-			msg = self.decode2914(value)
-		elif model == 0xC844 or model == 0xEC40:
-			# protocol version 3, pool thermometer, EC40 not yet tested
-			msg = self.decodeC844(value, model)
-		elif model == 0xD874:
-			# protocol version 3, UV index
-			msg = self.decodeD874(value)
-
+		model = ProtocolOregon.models.get(int(data['model'], 16))
+		if model is None:
+			return None
+		decoder, modelName = model
+		msg = decoder.decode(int(data['data'], 16))
 		if not msg:
 			return None
 
-		data['model'] = '%X' % model
+		data['model'] = modelName
 
 		for key in msg:
 			data[key] = msg[key]
 		return data
-
-	def decodeEA4C(self, value):
-		checksum = 0xE + 0xA + 0x4 + 0xC
-		checksum -= (value & 0xF) * 0x10
-		checksum -= 0xA
-		value >>= 8
-
-		checksumw = (value >> 4) & 0xF
-		neg = value & (1 << 3)
-		hundred = value & 3
-		checksum += (value & 0xF)
-		value >>= 8
-
-		temp2 = value & 0xF
-		temp1 = (value >> 4) & 0xF
-		checksum += temp2 + temp1
-		value >>= 8
-
-		temp3 = (value >> 4) & 0xF
-		battery = (value & 0xF)
-		checksum += (value & 0xF) + temp3
-		value >>= 8
-
-		checksum += ((value >> 4) & 0xF) + (value & 0xF)
-		address = value & 0xFF
-		value >>= 8
-
-		checksum += ((value >> 4) & 0xF) + (value & 0xF)
-		channel = (value >> 4) & 0x7
-
-		if checksum != checksumw:
-			return None
-
-		temp = int('%d%d' % (temp2, temp3))/10.0
-		temp = temp + (10*int(temp1)) + (100*hundred)
-		if neg:
-			temp = 0 - temp
-
-		valueList = []
-		valueList.append({'type': Device.TEMPERATURE, 'value': temp, 'scale': Device.SCALE_TEMPERATURE_CELCIUS})
-		return {'id': int(address), 'values': valueList, 'battery': self.formatBattery(battery)}
-
-	def decode1984(self, value, model):
-		# wind
-		crcCheck = value & 0xF # Perhaps CRC?
-		value >>= 4
-		messageChecksum1 = value & 0xF
-		value >>= 4
-		messageChecksum2 = value & 0xF
-
-		value >>= 4
-		avg1 = value & 0xF
-		value >>= 4
-		avg2 = value & 0xF
-		value >>= 4
-		avg3 = value & 0xF
-
-		value >>= 4
-		gust1 = value & 0xF
-		value >>= 4
-		gust2 = value & 0xF
-		value >>= 4
-		gust3 = value & 0xF
-
-		value >>= 4
-		unknown1 = value & 0xF
-		value >>= 4
-		unknown2 = value & 0xF
-
-		value >>= 4
-		direction = value & 0xF
-		directiondegrees = direction * 22.5
-
-		value >>= 4
-		battery = value & 0xF #PROBABLY battery
-
-		value >>= 4
-		rollingcode = ((value >> 4) & 0xF) + (value & 0xF)
-		checksum = ((value >> 4) & 0xF) + (value & 0xF)
-		value >>= 8
-		channel = value & 0xF
-
-		checksum += unknown1 + unknown2 + avg1 + avg2 + avg3 + gust1 + gust2 + gust3 + direction + battery + channel
-		if model == 0x1984:
-			checksum += 0x1 + 0x9 + 0x8 + 0x4
-		elif model == 0x1994:
-			checksum += 0x1 + 0x9 + 0x9 + 0x4
-
-		if not ((checksum >> 4) & 0xF == messageChecksum1 and (checksum & 0xF) == messageChecksum2):
-			#checksum error
-			return None
-
-		avg = (avg1*10) + avg2 + (avg3/10.0)
-
-		gust = (gust1*10) + gust2 + (gust3/10.0)
-
-		valueList = []
-		valueList.append({'type': Device.WINDDIRECTION, 'value': directiondegrees, 'scale': Device.SCALE_WIND_DIRECTION})
-		valueList.append({'type': Device.WINDAVERAGE, 'value': avg, 'scale': Device.SCALE_WIND_VELOCITY_MS})
-		valueList.append({'type': Device.WINDGUST, 'value': gust, 'scale': Device.SCALE_WIND_VELOCITY_MS})
-
-		return {'id': int(rollingcode), 'values': valueList, 'battery': self.formatBattery(battery)}
-
-
-	def decode1A2D(self, value):
-		checksum2 = value & 0xFF
-		value >>= 8
-		checksum1 = value & 0xFF
-		value >>= 8
-
-		checksum = ((value >> 4) & 0xF) + (value & 0xF)
-		hum1 = value & 0xF
-		value >>= 8
-
-		checksum += ((value >> 4) & 0xF) + (value & 0xF)
-		neg = value & (1 << 3)
-		hum2 = (value >> 4) & 0xF
-		value >>= 8
-
-		checksum += ((value >> 4) & 0xF) + (value & 0xF)
-		temp2 = value & 0xF
-		temp1 = (value >> 4) & 0xF
-		value >>= 8
-
-		battery = (value & 0xF)
-		checksum += ((value >> 4) & 0xF) + (value & 0xF)
-		temp3 = (value >> 4) & 0xF
-		value >>= 8
-
-		checksum += ((value >> 4) & 0xF) + (value & 0xF)
-		address = value & 0xFF
-		value >>= 8
-
-		checksum += ((value >> 4) & 0xF) + (value & 0xF)
-		channel = (value >> 4) & 0x7
-
-		checksum += 0x1 + 0xA + 0x2 + 0xD - 0xA
-
-		#TODO: Find out how checksum2 works
-		if checksum != checksum1:
-			return None
-
-		temp = (temp1*10) + temp2 + (temp3/10.0)
-		if neg:
-			temp = -temp
-
-		valueList = []
-		valueList.append({'type': Device.TEMPERATURE, 'value': temp, 'scale': Device.SCALE_TEMPERATURE_CELCIUS})
-		valueList.append({'type': Device.HUMIDITY, 'value': int('%d%d' % (hum1, hum2)), 'scale': Device.SCALE_HUMIDITY_PERCENT})
-		return {'id': int(address), 'values': valueList, 'battery': self.formatBattery(battery)}
-
-	def decode2914(self, value):
-		# rain
-		inchToCm = 25.4
-
-		messageChecksum1 = value & 0xF
-		value >>= 4
-		messageChecksum2 = value & 0xF
-
-		value >>= 4
-		totRain1 = value & 0xF
-		value >>= 4
-		totRain2 = value & 0xF
-		value >>= 4
-		totRain3 = value & 0xF
-		value >>= 4
-		totRain4 = value & 0xF
-		value >>= 4
-		totRain5 = value & 0xF
-		value >>= 4
-		totRain6 = value & 0xF
-
-		value >>= 4
-		rainRate1 = value & 0xF
-		value >>= 4
-		rainRate2 = value & 0xF
-		value >>= 4
-		rainRate3 = value & 0xF
-		value >>= 4
-		rainRate4 = value & 0xF
-
-		value >>= 4
-		battery = value & 0xF #PROBABLY battery
-
-		value >>= 4
-		rollingcode = ((value >> 4) & 0xF) + (value & 0xF)
-		checksum = ((value >> 4) & 0xF) + (value & 0xF)
-		value >>= 8
-		channel = value & 0xF
-
-		checksum += totRain1 + totRain2 + totRain3 + totRain4 + totRain5 + totRain6 + rainRate1 + rainRate2 + rainRate3 + rainRate4 + battery + channel + 0x2 + 0x9 + 0x1 + 0x4
-
-		if not ((checksum >> 4) & 0xF == messageChecksum1 and (checksum & 0xF) == messageChecksum2):
-			#checksum error
-			return None
-
-		totRain = '%d.%d%d%d' % (totRain3, totRain4, totRain5, totRain6)
-		if int(totRain2) > 0 or int(totRain1) > 0:
-			totRain = '%d%s' % (totRain2, totRain)
-			if int(totRain1) > 0:
-				totRain = '%d%s' % (totRain1, totRain)
-		totRain = round(float(totRain) * inchToCm, 1)
-
-		rainRate = '%d.%d%d' % (rainRate2, rainRate3, rainRate4)
-		if int(rainRate1) > 0:
-			rainRate = '%d%s' % (rainRate1, rainRate)
-		rainRate = round(float(rainRate) * inchToCm, 1)
-
-		valueList = []
-		valueList.append({'type': Device.RAINRATE, 'value': rainRate, 'scale': Device.SCALE_RAINRATE_MMH})
-		valueList.append({'type': Device.RAINTOTAL, 'value': totRain, 'scale': Device.SCALE_RAINTOTAL_MM})
-		return {'id': int(rollingcode), 'values': valueList, 'battery': self.formatBattery(battery)}
-
-
-	def decodeF824(self, value):
-		crcCheck = value & 0xF #PROBABLY CRC
-		value >>= 4
-		messageChecksum1 = value & 0xF
-		value >>= 4
-		messageChecksum2 = value & 0xF
-
-		value >>= 4
-		unknown = value & 0xF
-		value >>= 4
-		hum1 = value & 0xF
-		value >>= 4
-
-		hum2 = value & 0xF
-		value >>= 4
-		neg = value & 0xF
-		value >>= 4
-		temp1 = value & 0xF
-		value >>= 4
-		temp2 = value & 0xF
-		value >>= 4
-		temp3 = value & 0xF
-		value >>= 4
-		battery = value & 0xF #PROBABLY battery
-
-		value >>= 4
-		rollingcode = ((value >> 4) & 0xF) + (value & 0xF)
-		checksum = ((value >> 4) & 0xF) + (value & 0xF)
-		value >>= 8
-		channel = value & 0xF
-
-		checksum += unknown + hum1 + hum2 + neg + temp1 + temp2 + temp3 + battery + channel + 0xF + 0x8 + 0x2 + 0x4
-
-		if not ((checksum >> 4) & 0xF == messageChecksum1 and (checksum & 0xF) == messageChecksum2):
-			#checksum error
-			return None
-
-		temp = (temp1*10) + temp2 + (temp3/10.0)
-		if neg:
-			temp = -temp
-
-		valueList = []
-		valueList.append({'type': Device.TEMPERATURE, 'value': temp, 'scale': Device.SCALE_TEMPERATURE_CELCIUS})
-		valueList.append({'type': Device.HUMIDITY, 'value': int('%d%d' % (hum1, hum2)), 'scale': Device.SCALE_HUMIDITY_PERCENT})
-		return {'id': int(rollingcode), 'values': valueList}
-
-	def decodeC844(self, value, model):
-		messageChecksum1 = value & 0xF
-		value >>= 4
-		messageChecksum2 = value & 0xF
-
-		value >>= 4
-		neg = value & 0xF
-		value >>= 4
-		temp1 = value & 0xF
-		value >>= 4
-		temp2 = value & 0xF
-		value >>= 4
-		temp3 = value & 0xF
-		value >>= 4
-		battery = value & 0xF #PROBABLY battery
-
-		value >>= 4
-		rollingcode = ((value >> 4) & 0xF) + (value & 0xF)
-		checksum = ((value >> 4) & 0xF) + (value & 0xF)
-		value >>= 8
-		channel = value & 0xF
-
-		checksum += neg + temp1 + temp2 + temp3 + battery + channel
-
-		if model == 0xC844:
-			checksum += 0xC + 0x8 + 0x4 + 0x4
-		elif model == 0xEC40:
-			checksum += 0xE + 0xC + 0x4 + 0x0
-
-		if not ((checksum >> 4) & 0xF == messageChecksum1 and (checksum & 0xF) == messageChecksum2):
-			#checksum error
-			return None
-
-		temp = (temp1*10) + temp2 + (temp3/10.0)
-		if neg:
-			temp = -temp
-
-		valueList = []
-		valueList.append({'type': Device.TEMPERATURE, 'value': temp, 'scale': Device.SCALE_TEMPERATURE_CELCIUS})
-		return {'id': int(rollingcode), 'values': valueList}
-
-	def decodeD874(self, value):
-		messageChecksum1 = value & 0xF
-		value >>= 4
-		messageChecksum2 = value & 0xF
-
-		value >>= 4
-		unknown1 = value & 0xF
-		value >>= 4
-		unknown2 = value & 0xF
-		value >>= 4
-		uv1 = value & 0xF
-		value >>= 4
-		uv2 = value & 0xF
-		value >>= 4
-		battery = value & 0xF #PROBABLY battery
-
-		value >>= 4
-		rollingcode = ((value >> 4) & 0xF) + (value & 0xF)
-		checksum = ((value >> 4) & 0xF) + (value & 0xF)
-		value >>= 8
-		channel = value & 0xF
-
-		checksum += unknown1 + unknown2 + uv1 + uv2 + battery + channel + 0xD + 0x8 + 0x7 + 0x4
-
-		if not ((checksum >> 4) & 0xF == messageChecksum1 and (checksum & 0xF) == messageChecksum2):
-			#checksum error
-			pass #TODO make checksums work
-
-		if not (checksum & 0xF == messageChecksum1):
-			#TODO temporary partial checksum check that seems to work
-			return None
-
-		uvindex = int('%d%d' % (uv1, uv2)) #TODO correct?
-
-		valueList = []
-		valueList.append({'type': Device.UV, 'value': uvindex, 'scale': Device.SCALE_UV_INDEX})
-		return {'id': int(rollingcode), 'values': valueList, 'battery': self.formatBattery(battery)}
-
-	def formatBattery(self, battery):
-		if battery & 0x4:
-			return Device.BATTERY_LOW
-		return Device.BATTERY_OK
@@ -1,8 +1,8 @@
 # -*- coding: utf-8 -*-
 
+from collections import OrderedDict
 import logging
 import time
-from threading import Timer
 
 from base import Application, implements, Plugin, signal
 from board import Board
@@ -11,7 +11,9 @@ from tellduslive.base import TelldusLive, ITelldusLiveObserver
 
 from .Protocol import Protocol
 from .Adapter import Adapter
+from .Capture import RawCapture
 from .RF433Msg import RF433Msg
+from .SensorLifecycle import SensorLifecycle
 
 class RF433Node(Device):
 	def __init__(self):
@@ -41,6 +43,7 @@ class SensorNode(RF433Node):
 		self._packageCount = 0
 		self.batteryLevel = None
 		self.declaredDead = False
+		self.lastSeen = time.time()
 
 	def battery(self):
 		return self.batteryLevel
@@ -62,27 +65,38 @@ class SensorNode(RF433Node):
 	def isSensor():
 		return True
 
-	def isValid(self):
+	def confirmPackages(self):
+		"""Enough packages has been received, add the sensor on next update"""
+		self._packageCount = 6
+
+	def isValid(self, now=None):
 		if self._name and self._name != "Device " + str(self.localId()) and not self._ignored:
 			return True  # name is set and not ignored, don't clean up automatically
-		if not self._sensorValues:
-			if not self.declaredDead:
-				self.declaredDead = time.time()
-				return True  # no sensor values, let the sensor exist for a week before deleting
-			if self.declaredDead < (time.time() - 604800):
-				return False  # Sensor has existed for a week, with no new incoming values. Delete.
-			return True
-
-		for valueType in self._sensorValues:
-			for sensorType in self._sensorValues[valueType]:
-				if sensorType['lastUpdated'] > (time.time() - 604800):
-					# at least some value was updated during the last week
-					return True
-		return False
+		# at least some value must have been received during the last week
+		return self.lastSeen > (now or time.time()) - SensorLifecycle.MAX_AGE
+
+	def loadLastSeen(self):
+		"""Restore lastSeen from the stored values, only needed once when loading"""
+		lastUpdated = [
+			value['lastUpdated']
+			for values in self._sensorValues.values()
+			for value in values
+			if 'lastUpdated' in value
+		]
+		if lastUpdated:
+			self.lastSeen = max(lastUpdated)
+			return
+		if not self.declaredDead:
+			# no sensor values, let the sensor exist for a week before deleting
+			self.declaredDead = time.time()
+		self.lastSeen = self.declaredDead
 
 	def model(self):
 		return self._model
 
+	def sensorKey(self):
+		return (self._protocol, self._model, self._sensorId)
+
 	def name(self):
 		# empty name for new 433-sensors (becomes "No name" in Telldus Live!)
 		if self._name is not None and self._name != 'Device ' + str(self.localId()):
@@ -106,6 +120,7 @@ class SensorNode(RF433Node):
 		self._sensorId = params.setdefault('sensorId', 0)
 
 	def updateValues(self, data):
+		self.lastSeen = time.time()
 		if self._packageCount == 6:
 			if self._manager:
 				# add to manager only now, that equals no live updates before this,
@@ -117,8 +132,7 @@ class SensorNode(RF433Node):
 			return  # don't update any values yet
 		if self.declaredDead:
 			self.declaredDead = False
-		for value in data:
-			self.setSensorValue(value['type'], value['value'], value['scale'])
+		self.setSensorValues(data)
 
 class DeviceNode(RF433Node):
 	def __init__(self, controller):
@@ -129,14 +143,11 @@ class DeviceNode(RF433Node):
 		self._protocolParams = {}
 
 	def _command(self, action, value, success, failure, **__kwargs):
-		protocol = Protocol.protocolInstance(self._protocol)
-		if not protocol:
+		if self._protocol not in Protocol.protocols:
 			logging.warning("Unknown protocol %s", self._protocol)
 			failure(0)
 			return
-		protocol.setModel(self._model)
-		protocol.setParameters(self._protocolParams)
-		msg = protocol.stringForMethod(action, value)
+		msg = Protocol.encodeMethod(self._protocol, self._model, self._protocolParams, action, value)
 		if msg is None:
 			failure(0)
 			logging.error("Could not encode rf-data for %s:%s %s", self._protocol, self._model, action)
@@ -156,11 +167,7 @@ class DeviceNode(RF433Node):
 			self.controller.queue(RF433Msg('S', msg['S'], prefixes, success=_success, failure=fail))
 
 	def deviceType(self):
-		protocol = Protocol.protocolInstance(self._protocol)
-		if not protocol:
-			return Device.TYPE_SWITCH_OUTLET
-		protocol.setModel(self._model)
-		return protocol.deviceType()
+		return Protocol.deviceTypeForModel(self._protocol, self._model)
 
 	@staticmethod
 	def isDevice():
@@ -171,11 +178,7 @@ class DeviceNode(RF433Node):
 		return False
 
 	def methods(self):
-		protocol = Protocol.protocolInstance(self._protocol)
-		if not protocol:
-			return 0
-		protocol.setModel(self._model)
-		return protocol.methods()
+		return Protocol.methodsForModel(self._protocol, self._model)
 
 	def model(self):
 		return self._model
@@ -206,13 +209,22 @@ class RF433(Plugin):
 		'18F25K50': 1
 	}
 
+	# Sensors usually repeat each frame 2-3 times in a burst. Identical frames
+	# received within this many seconds are dropped before decoding.
+	DUPLICATE_FRAME_WINDOW = 2.0
+
 	def __init__(self):
 		self.version = 0
 		self.hwVersion = None
 		self.devices = []
-		self.sensors = []
+		self.deviceIndex = {}
+		# Sensors by (protocol, model, sensorId)
+		self.sensorIndex = {}
+		self.recentFrames = OrderedDict()
 		self.rawEnabled = False
 		self.rawEnabledAt = 0
+		self.capture = RawCapture()
+		self.lifecycle = SensorLifecycle()
 		self.dev = Adapter(self, Board.rf433Port())
 		self.deviceManager = DeviceManager(self.context)
 		self.registerSensorCleanup()
@@ -222,7 +234,6 @@ class RF433(Plugin):
 				continue
 			if params['type'] == 'sensor':
 				device = SensorNode()
-				self.sensors.append(device)
 			elif params['type'] == 'device':
 				device = DeviceNode(self.dev)  # pylint: disable=R0204
 				self.devices.append(device)
@@ -237,9 +248,14 @@ class RF433(Plugin):
 				device.batteryLevel = dev.batteryLevel
 				if hasattr(dev, 'declaredDead'):
 					device.declaredDead = dev.declaredDead
+				device.loadLastSeen()
+				self.sensorIndex.setdefault(device.sensorKey(), device)
+			else:
+				self.__indexDevice(device)
 
 			self.deviceManager.addDevice(device)
 
+		self.lifecycle.load(self.sensorIndex.values())
 		self.deviceManager.finishedLoading('433')
 		self.dev.queue(RF433Msg('V', success=self.__version, failure=self.__noVersion))
 		self.dev.queue(RF433Msg('H', success=self.__hwVersion, failure=self.__noHWVersion))
@@ -254,15 +270,26 @@ class RF433(Plugin):
 			'protocolParams': params
 		})
 		self.devices.append(device)
+		self.__indexDevice(device)
 		self.deviceManager.addDevice(device)
 
-	def cleanupSensors(self):
-		for i, sensor in enumerate(self.sensors):
-			if not sensor.isValid():
-				self.deviceManager.removeDevice(sensor.id())
-				del self.sensors[i]
-
-		self.deviceManager.sensorsUpdated()
+	def cleanupSensors(self, removed=False):
+		"""
+		Remove sensors not seen for a while. Sensors are removed in batches,
+		if there are more to remove the cleanup continues after other queued
+		work has run. The sensor list is reported once the cleanup is done.
+		"""
+		expired = self.lifecycle.expired()
+		for sensor in expired:
+			self.sensorIndex.pop(sensor.sensorKey(), None)
+		if expired:
+			self.deviceManager.removeDevices([sensor.id() for sensor in expired])
+		if len(expired) == SensorLifecycle.BATCH_SIZE:
+			Application().queue(self.cleanupSensors, removed=True)
+			return
+		if expired or removed:
+			# Removed sensors are not reported to Telldus Live! one by one
+			self.deviceManager.sensorsUpdated()
 
 	@TelldusLive.handler('rf433')
 	def __handleCommand(self, msg):
@@ -284,11 +311,13 @@ class RF433(Plugin):
 			deviceId = data['device']
 			for device in self.devices:
 				if device.id() == deviceId:
+					self.__unindexDevice(device)
 					device.setParams({
 						'protocol': data['protocol'],
 						'model': data['model'],
 						'protocolParams': data['parameters']
 					})
+					self.__indexDevice(device)
 					device.paramUpdated('')
 					break
 
@@ -297,9 +326,25 @@ class RF433(Plugin):
 			for device in self.devices:
 				if device.id() == deviceId:
 					self.deviceManager.removeDevice(deviceId)
+					self.__unindexDevice(device)
 					self.devices.remove(device)
 					return
 
+		elif action == 'captureRecord':
+			if data['value']:
+				self.capture.startRecording(data.get('protocols'), data.get('models'))
+			else:
+				self.capture.stopRecording()
+
+		elif action == 'captureStream':
+			if data['value']:
+				self.capture.startStreaming(data.get('protocols'), data.get('models'), data.get('rate'))
+			else:
+				self.capture.stopStreaming()
+
+		elif action == 'queueMetrics':
+			self.live.pushToWeb('rf433', 'queueMetrics', self.dev.metrics())
+
 		elif action == 'rawEnabled':
 			if data['value']:
 				self.rawEnabled = True
@@ -322,6 +367,7 @@ class RF433(Plugin):
 			return
 		msg = Protocol.decodeData(msg)
 		for cmdData in msg:
+			self.capture.decoded(cmdData)
 			self.decodeCommandData(cmdData)
 			if self.rawEnabled:
 				if self.rawEnabledAt < (time.time() - 600):
@@ -337,34 +383,36 @@ class RF433(Plugin):
 		methods = Protocol.methodsForProtocol(protocol, model)
 		if not method & methods:
 			return
-		for device in self.devices:
-			params = device.params()
-			if params['protocol'] != protocol:
-				continue
-			if not method & device.methods():
-				continue
-			deviceParams = params['protocolParams']
-			thisDevice = True
-			for parameter in Protocol.parametersForProtocol(protocol, model):
-				if parameter not in msg:
-					thisDevice = False
-					break
-				if parameter not in deviceParams:
-					thisDevice = False
-					break
-				convertedParameter = deviceParams[parameter]
-				try:
-					convertedParameter = str(convertedParameter)
-				except Exception as __error:
-					pass
-				if msg[parameter] != convertedParameter:
-					thisDevice = False
-					break
-			if thisDevice:
+		key = RF433.deviceIndexKey(protocol, model, msg)
+		if key is None:
+			return
+		for device in self.deviceIndex.get(key, []):
+			if method & device.methods():
 				device.setState(method, None)
 
+	@staticmethod
+	def deviceIndexKey(protocol, model, params):
+		"""
+		Returns the key used for looking up devices matching received data.
+		Only the parameters significant for the protocol are used.
+		"""
+		values = []
+		for parameter in Protocol.parametersForProtocol(protocol, model):
+			if parameter not in params:
+				return None
+			value = params[parameter]
+			try:
+				value = str(value)
+			except Exception as __error:
+				pass
+			values.append(value)
+		return (protocol, tuple(values))
+
 	def decodeData(self, cmd, params):
 		if cmd == 'W':
+			self.capture.raw(params)
+			if params.get('class') == 'sensor' and self.__isDuplicateFrame(params):
+				return
 			self.decode(params)
 		elif cmd == 'V':
 			# New version received, probably after firmware upload
@@ -372,6 +420,14 @@ class RF433(Plugin):
 		else:
 			logging.debug("Unknown data: %s", str(cmd))
 
+	def decodeFrames(self, frames):
+		"""Decode a list of (cmd, params) tuples received in one read"""
+		for cmd, params in frames:
+			try:
+				self.decodeData(cmd, params)
+			except Exception as error:
+				Application.printException(error)
+
 	def decodeSensor(self, msg):
 		protocol = Protocol.protocolInstance(msg['protocol'])
 		if not protocol:
@@ -380,31 +436,57 @@ class RF433(Plugin):
 		data = protocol.decodeData(msg)
 		if not data:
 			return
+		self.capture.decoded(data)
 		protocol = data['protocol']
 		model = data['model']
 		sensorId = data['id']
 		sensorData = data['values']
-		sensor = None
-		for lsensor in self.sensors:
-			if lsensor.compare(protocol, model, sensorId):
-				sensor = lsensor
-				break
+		sensorKey = (protocol, model, sensorId)
+		sensor = self.sensorIndex.get(sensorKey)
 		if sensor is None:
+			if not self.lifecycle.admit(sensorKey):
+				return  # don't add until enough packages has been received
 			sensor = SensorNode()
 			sensor.setParams({'protocol': protocol, 'model': model, 'sensorId': sensorId})
 			sensor.setManager(self.deviceManager)
-			self.sensors.append(sensor)
+			sensor.confirmPackages()
+			self.sensorIndex[sensorKey] = sensor
 		if 'battery' in data:
 			sensor.batteryLevel = data['battery']
 		sensor.updateValues(sensorData)
+		self.lifecycle.seen(sensor)
 
 	def registerSensorCleanup(self):
 		"""Register scheduled job to clean up sensors that have not been updated for a while"""
-		Application().registerScheduledTask(self.cleanupSensors, hours=12)  # every 12th hour
-		tmr = Timer(600, self.cleanupSensors)  # run a first time after 10 minutes
-		tmr.daemon = True
-		tmr.name = 'Sensor cleanup'
-		tmr.start()
+		Application().registerScheduledTask(self.cleanupSensors, minutes=10)
+		Application().registerScheduledTask(self.deviceManager.sensorsUpdated, hours=12)  # every 12th hour
+
+	def __isDuplicateFrame(self, msg):
+		now = time.time()
+		# Expire old frames, the oldest are first in the dict
+		while self.recentFrames:
+			oldestKey = next(iter(self.recentFrames))
+			if self.recentFrames[oldestKey] > now - RF433.DUPLICATE_FRAME_WINDOW:
+				break
+			del self.recentFrames[oldestKey]
+		key = (msg.get('protocol'), msg.get('model'), msg.get('data'))
+		if key in self.recentFrames:
+			return True
+		self.recentFrames[key] = now
+		return False
+
+	def __indexDevice(self, device):
+		key = RF433.deviceIndexKey(device.protocol(), device.model(), device.parameters())
+		if key is not None:
+			self.deviceIndex.setdefault(key, []).append(device)
+
+	def __unindexDevice(self, device):
+		key = RF433.deviceIndexKey(device.protocol(), device.model(), device.parameters())
+		devices = self.deviceIndex.get(key, [])
+		if device in devices:
+			devices.remove(device)
+		if not devices:
+			self.deviceIndex.pop(key, None)
 
 	@staticmethod
 	def __noVersion():
@@ -3,13 +3,41 @@
 from base import Application
 
 class RF433Msg(object):
-	def __init__(self, cmd, args = '', prefixes = {}, success=None, failure=None):
+	# Seconds to wait for the reply to each command type. The timeout for S
+	# is calculated from the transmit time, see sendDuration().
+	TIMEOUTS = {
+		'V': 1,
+		'H': 1,
+	}
+	DEFAULT_TIMEOUT = 5
+	# Number of times each command type is resent if no reply was received.
+	# S is never resent, commands like toggle or dim steps must not be
+	# transmitted twice.
+	RETRIES = {
+		'V': 2,
+		'H': 2,
+	}
+	# Repeats and pause (ms) used by the adapter if not given in the command
+	DEFAULT_REPEATS = 10
+	DEFAULT_PAUSE = 11
+	# Seconds to wait for the reply after the transmit should have finished
+	SEND_MARGIN = 2
+
+	def __init__(self, cmd, args = '', prefixes = {}, success=None, failure=None, timeout=None, retries=None):
 		self._cmd = cmd
 		self._args = args
 		self._prefixes = prefixes
-		self._success = success
-		self._failure = failure
-		self.queued = None
+		self._callbacks = [(success, failure)]
+		if timeout is not None:
+			self._timeout = timeout
+		elif cmd == 'S':
+			self._timeout = self.sendDuration() + RF433Msg.SEND_MARGIN
+		else:
+			self._timeout = RF433Msg.TIMEOUTS.get(cmd, RF433Msg.DEFAULT_TIMEOUT)
+		self.retries = RF433Msg.RETRIES.get(cmd, 0) if retries is None else retries
+		self.attempts = 0
+		self.queuedAt = None
+		self.sentAt = None
 
 	def cmd(self):
 		return self._cmd
@@ -20,13 +48,36 @@ class RF433Msg(object):
 			retval = '%s%s%s' % (p, chr(self._prefixes[p]), retval)
 		return retval
 
+	def merge(self, msg):
+		"""
+		Merge the callbacks from an identical message into this one. Both
+		senders will be notified when this message is answered.
+		"""
+		self._callbacks.extend(msg._callbacks)  # pylint: disable=W0212
+
 	def response(self, params):
-		if self._success:
-			Application().queue(self._success, params)
+		for success, __failure in self._callbacks:
+			if success:
+				Application().queue(success, params)
+
+	def sendDuration(self):
+		"""
+		Returns the estimated number of seconds the adapter needs to transmit
+		an S command. Each character is a pulse length in units of 10 us and
+		the whole frame is sent R times with a pause of P ms in between.
+		"""
+		repeats = self._prefixes.get('R', RF433Msg.DEFAULT_REPEATS)
+		pause = self._prefixes.get('P', RF433Msg.DEFAULT_PAUSE)
+		frame = sum([ord(c) for c in self._args]) / 100000.0
+		return repeats * (frame + pause / 1000.0)
 
 	def timeout(self):
-		if self._failure:
-			Application().queue(self._failure)
+		for __success, failure in self._callbacks:
+			if failure:
+				Application().queue(failure)
+
+	def timeoutValue(self):
+		return self._timeout
 
 	@staticmethod
 	def parseResponse(data):
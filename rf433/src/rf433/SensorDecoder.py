@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+
+from telldus import Device
+
+class SensorDecoder(object):
+	"""
+	Decodes sensor data from a declarative layout. The layout is compiled
+	into shift and mask tables once so decoding a value is only integer
+	arithmetic.
+
+	A layout is a dict with these keys:
+
+	``fields``
+	  A list of ``(name, spec)`` tuples. Each spec has one of these keys:
+
+	  * ``nibbles``: nibble indexes, most significant first, combined into an
+	    integer. Nibble 0 is the least significant nibble of the data. An
+	    index can also be a tuple ``(index, mask)``.
+	  * ``bcd``: like ``nibbles`` but each nibble is a decimal digit. Data with
+	    a digit above 9 is discarded. ``decimals`` sets the number of digits
+	    after the decimal point.
+	  * ``nibbleSum``: the sum of the nibbles.
+	  * ``bits``: a tuple ``(offset, length)`` with the bit offset counted
+	    from the least significant bit.
+	  * ``fields``: a list of ``(name, multiplier)`` with fields defined
+	    earlier.
+
+	  The value can then be modified, in this order, with ``add``,
+	  ``divide``, ``factor`` and ``round``. ``sign`` is a nibble ``(index,
+	  mask)`` and ``signBit`` a bit offset. The value is negated if it is set.
+
+	``checksum``
+	  Either a nibble sum: ``sum`` lists the nibbles, or ``(index, weight)``
+	  tuples, to add to ``offset``. Only the bits in ``mask`` are compared to
+	  the value of the ``target`` nibbles, all bits are compared if the mask
+	  is None. Or a CRC-8: ``crc8`` is the polynomial, calculated on the
+	  bytes in ``bits`` and compared to the bits in ``target``.
+
+	``require``
+	  A list of ``(field, min, max)``. The data is discarded unless all
+	  fields are within their limits.
+
+	``id``, ``battery``
+	  The field holding the sensor id and the battery status. A battery field
+	  that is not zero means the battery is low.
+
+	``values``
+	  A list of ``(valueType, scale, field)`` tuples.
+
+	``model``
+	  Optional model name to return.
+	"""
+
+	def __init__(self, layout):
+		self.fields = [(name, SensorDecoder.__compileField(spec)) for (name, spec) in layout['fields']]
+		self.checksum = SensorDecoder.__compileChecksum(layout.get('checksum'))
+		self.require = layout.get('require', [])
+		self.idField = layout['id']
+		self.batteryField = layout.get('battery')
+		self.values = layout['values']
+		self.model = layout.get('model')
+
+	def checksumValid(self, value):
+		if self.checksum is None:
+			return True
+		kind, parts, offset, mask, target = self.checksum
+		if kind == 'crc8':
+			table, shifts = parts
+			checksum = 0
+			for shift in shifts:
+				checksum = table[checksum ^ ((value >> shift) & 0xFF)]
+		else:
+			checksum = offset
+			for shift, weight in parts:
+				checksum += ((value >> shift) & 0xF) * weight
+		if mask is not None:
+			checksum &= mask
+		return checksum == SensorDecoder.__extract(target, value)
+
+	def decode(self, value):
+		"""
+		Decode the value. Returns a dict with the keys id, values and, if
+		found in the layout, battery and model. Returns None if the value is
+		not valid for this layout.
+		"""
+		if not self.checksumValid(value):
+			return None
+		fields = {}
+		for name, field in self.fields:
+			fieldValue = SensorDecoder.__fieldValue(field, value, fields)
+			if fieldValue is None:
+				return None
+			fields[name] = fieldValue
+		for name, minValue, maxValue in self.require:
+			if fields[name] < minValue or fields[name] > maxValue:
+				return None
+		retval = {
+			'id': int(fields[self.idField]),
+			'values': [
+				{'type': valueType, 'value': fields[name], 'scale': scale}
+				for (valueType, scale, name) in self.values
+			],
+		}
+		if self.batteryField is not None:
+			retval['battery'] = Device.BATTERY_LOW if fields[self.batteryField] else Device.BATTERY_OK
+		if self.model is not None:
+			retval['model'] = self.model
+		return retval
+
+	@staticmethod
+	def crc8Table(polynomial):
+		table = []
+		for i in range(256):
+			crc = i
+			for __bit in range(8):
+				crc = ((crc << 1) ^ polynomial) if crc & 0x80 else (crc << 1)
+			table.append(crc & 0xFF)
+		return table
+
+	@staticmethod
+	def __compileChecksum(spec):
+		if spec is None:
+			return None
+		if 'crc8' in spec:
+			offset, length = spec['bits']
+			shifts = range(offset + length - 8, offset - 1, -8)
+			parts = (SensorDecoder.crc8Table(spec['crc8'] & 0xFF), shifts)
+			target = SensorDecoder.__compileBits(spec['target'])
+			return ('crc8', parts, 0, None, target)
+		parts = []
+		for nibble in spec['sum']:
+			index, weight = nibble if isinstance(nibble, tuple) else (nibble, 1)
+			parts.append((index*4, weight))
+		target = SensorDecoder.__compileNibbles(spec['target'], 16)
+		return ('sum', parts, spec.get('offset', 0), spec.get('mask'), target)
+
+	@staticmethod
+	def __compileBits(bits):
+		offset, length = bits
+		return [(offset, (1 << length) - 1, 1)]
+
+	@staticmethod
+	def __compileField(spec):
+		if 'nibbles' in spec:
+			kind, parts = 'int', SensorDecoder.__compileNibbles(spec['nibbles'], 16)
+		elif 'bcd' in spec:
+			kind, parts = 'bcd', SensorDecoder.__compileNibbles(spec['bcd'], 10)
+		elif 'nibbleSum' in spec:
+			kind, parts = 'int', [(index*4, 0xF, 1) for index in spec['nibbleSum']]
+		elif 'bits' in spec:
+			kind, parts = 'int', SensorDecoder.__compileBits(spec['bits'])
+		elif 'fields' in spec:
+			kind, parts = 'fields', spec['fields']
+		else:
+			raise ValueError('Unknown field specification %s' % spec)
+		sign = None
+		if 'sign' in spec:
+			index, mask = spec['sign']
+			sign = (index*4, mask)
+		elif 'signBit' in spec:
+			sign = (spec['signBit'], 1)
+		divide = spec.get('divide')
+		if kind == 'bcd' and spec.get('decimals'):
+			divide = float(10**spec['decimals'])
+		return (kind, parts, spec.get('add'), divide, spec.get('factor'), spec.get('round'), sign)
+
+	@staticmethod
+	def __compileNibbles(nibbles, base):
+		parts = []
+		for i, nibble in enumerate(nibbles):
+			index, mask = nibble if isinstance(nibble, tuple) else (nibble, 0xF)
+			parts.append((index*4, mask, base**(len(nibbles)-i-1)))
+		return parts
+
+	@staticmethod
+	def __extract(parts, value):
+		retval = 0
+		for shift, mask, multiplier in parts:
+			retval += ((value >> shift) & mask) * multiplier
+		return retval
+
+	@staticmethod
+	def __fieldValue(field, value, fields):
+		kind, parts, add, divide, factor, roundTo, sign = field
+		if kind == 'bcd':
+			fieldValue = 0
+			for shift, mask, multiplier in parts:
+				digit = (value >> shift) & mask
+				if digit > 9:
+					return None
+				fieldValue += digit * multiplier
+		elif kind == 'fields':
+			fieldValue = 0
+			for name, multiplier in parts:
+				fieldValue += fields[name] * multiplier
+		else:
+			fieldValue = SensorDecoder.__extract(parts, value)
+		if add is not None:
+			fieldValue += add
+		if divide is not None:
+			fieldValue = fieldValue / divide
+		if factor is not None:
+			fieldValue = fieldValue * factor
+		if roundTo is not None:
+			fieldValue = round(fieldValue, roundTo)
+		if sign is not None and (value >> sign[0]) & sign[1]:
+			fieldValue = 0 - fieldValue
+		return fieldValue
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+
+from collections import OrderedDict
+import time
+
+class SensorLifecycle(object):
+	"""
+	Keeps the 433 MHz sensors ordered by the time they were last seen so
+	sensors not heard from in a long time can be found without scanning all
+	sensors.
+
+	Unknown sensors must send a number of packages before they are added.
+	Until then only a package count is kept for them in a fixed size
+	admission table. When the table is full the candidate not seen for the
+	longest time is dropped, so sensors belonging to the neighbours does not
+	grow the memory usage.
+	"""
+	MAX_AGE = 604800  # One week
+	# Number of packages received before a new sensor is added
+	ADMISSION_PACKAGES = 6
+	CANDIDATE_MAX_AGE = 3600
+	MAX_CANDIDATES = 256
+	# Maximum number of sensors removed in each cleanup
+	BATCH_SIZE = 50
+
+	def __init__(self):
+		# Least recently seen first
+		self.sensors = OrderedDict()
+		# Package count and last seen for sensors not yet added, by sensor key
+		self.candidates = OrderedDict()
+
+	def admit(self, sensorKey, now=None):
+		"""
+		Count a package from an unknown sensor. Returns True when enough
+		packages has been received and the sensor should be added.
+		"""
+		count, __lastSeen = self.candidates.pop(sensorKey, (0, 0))
+		if count >= SensorLifecycle.ADMISSION_PACKAGES:
+			return True
+		self.candidates[sensorKey] = (count + 1, now or time.time())
+		if len(self.candidates) > SensorLifecycle.MAX_CANDIDATES:
+			self.candidates.popitem(last=False)
+		return False
+
+	def expired(self, now=None):
+		"""
+		Remove and return sensors that should be deleted. At most
+		:py:attr:`BATCH_SIZE` sensors are returned each call, call again later
+		to continue. Candidates not seen for a while are forgotten.
+		"""
+		now = now or time.time()
+		while self.candidates:
+			key = next(iter(self.candidates))
+			if self.candidates[key][1] > now - SensorLifecycle.CANDIDATE_MAX_AGE:
+				break
+			del self.candidates[key]
+		retval = []
+		examined = 0
+		while self.sensors and len(retval) < SensorLifecycle.BATCH_SIZE \
+		      and examined < len(self.sensors):
+			key = next(iter(self.sensors))
+			sensor = self.sensors[key]
+			if sensor.lastSeen > now - SensorLifecycle.MAX_AGE:
+				break
+			examined = examined + 1
+			del self.sensors[key]
+			if sensor.isValid(now):
+				# Kept even though not seen in a long time (e.g. named by the
+				# user), move it last so it is not examined again each cleanup
+				self.sensors[key] = sensor
+				continue
+			retval.append(sensor)
+		return retval
+
+	def load(self, sensors):
+		"""Add sensors loaded from storage"""
+		for sensor in sorted(sensors, key=lambda sensor: sensor.lastSeen):
+			self.seen(sensor)
+
+	def seen(self, sensor):
+		"""Call this when data was received from a sensor"""
+		key = sensor.sensorKey()
+		self.sensors.pop(key, None)
+		self.sensors[key] = sensor
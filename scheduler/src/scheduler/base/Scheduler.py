@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
-import copy
 from datetime import date, datetime, timedelta
+import heapq
+import itertools
 import random
 import threading
 import time
@@ -19,12 +20,20 @@ class Scheduler(Plugin):
 
 	def __init__(self):
 		self.running = False
-		#self.runningJobsLock = threading.Lock() #TODO needed?
-		self.jobsLock = threading.Lock()
-		self.maintenanceJobsLock = threading.Lock()
+		# Protects the job queues. The thread waits on it until the next job is
+		# due or the jobs are changed.
+		self.lock = threading.Condition(threading.Lock())
+		self.counter = itertools.count()
+		# Heap of (nextRunTime, id, jobData)
 		self.maintenanceJobs = []
 		self.lastMaintenanceJobId = 0
 		self.runningJobs = {} #id:s as keys
+		# Heaps of (nextRunTime, counter, job) for the scheduled and the running jobs
+		self.jobQueue = []
+		self.runningJobQueue = []
+		# Timer waking up the thread when the first job is due
+		self.wakeupTimer = None
+		self.wakeupTime = None
 		self.settings = Settings('telldus.scheduler')
 		Application().registerShutdown(self.stop)
 		Application().registerMaintenanceJobHandler(self.addMaintenanceJobGeneric)
@@ -52,11 +61,12 @@ class Scheduler(Plugin):
 		Note, if the next nextRunTime needs to be calculated, it's better to do that
 		in the callback-method, and add a new job from there, instead of using "recurrence" """
 		jobData = {'nextRunTime': nextRunTime, 'callback': timeoutCallback, 'recurrence': recurrence}
-		with self.maintenanceJobsLock:
+		with self.lock:
 			self.lastMaintenanceJobId = self.lastMaintenanceJobId + 1
 			jobData['id'] = self.lastMaintenanceJobId  # add an ID, make it possible to remove it someday
-			self.maintenanceJobs.append(jobData)
-			self.maintenanceJobs.sort(key=lambda jobData: jobData['nextRunTime'])
+			heapq.heappush(self.maintenanceJobs, (nextRunTime, jobData['id'], jobData))
+			if self.maintenanceJobs[0][2] is jobData:
+				self.lock.notify()
 			return self.lastMaintenanceJobId
 
 	def calculateJobs(self, jobs):
@@ -67,9 +77,11 @@ class Scheduler(Plugin):
 			if self.calculateNextRunTime(job):
 				newJobs.append(job)
 
-		newJobs.sort(key=lambda job: job['nextRunTime'])
-		with self.jobsLock:
+		with self.lock:
 			self.jobs = newJobs
+			self.jobQueue = [(job['nextRunTime'], next(self.counter), job) for job in newJobs]
+			heapq.heapify(self.jobQueue)
+			self.lock.notify()
 
 	def calculateNextRunTime(self, job):
 		"""Calculates nextRunTime for a job, depending on time, weekday and timezone."""
@@ -188,20 +200,23 @@ class Scheduler(Plugin):
 					# run time for this job was passed during downtime, but it was passed within the
 					# max-runtime, and the last time it was executed (successfully) was before this
 					# run time, so it should be run again...
-					jobCopy = copy.deepcopy(job)
+					jobCopy = dict(job)
 					jobCopy['originalRepeats'] = job['reps']
 					jobCopy['nextRunTime'] = runTime
 					jobCopy['maxRunTime'] = runTimeMax #approximate maxRunTime, sanity check
-					self.runningJobs[jobId] = jobCopy
+					with self.lock:
+						self.__queueRunningJob(jobCopy)
 					return
 			i = i + 1
 
 	def deleteJob(self, jobId):
-		with self.jobsLock:
+		with self.lock:
 			# Test this! It should be fast and keep original reference, they say (though it will
 			# iterate all, even if it could end after one)
 			self.jobs[:] = [x for x in self.jobs if x['id'] != jobId]
-			if jobId in self.runningJobs:	#TODO this might require a lock too?
+			self.jobQueue = [x for x in self.jobQueue if x[2]['id'] != jobId]
+			heapq.heapify(self.jobQueue)
+			if jobId in self.runningJobs:
 				self.runningJobs[jobId]['retries'] = 0
 
 			executedJobs = self.settings.get('executedJobs', {})
@@ -268,9 +283,9 @@ class Scheduler(Plugin):
 		active = self.calculateNextRunTime(job)
 		self.deleteJob(job['id']) #delete the job if it already exists (update)
 		if active:
-			with self.jobsLock:
+			with self.lock:
 				self.jobs.append(job)
-				self.jobs.sort(key=lambda job: job['nextRunTime'])
+				self.__queueJob(job)
 		self.settings['jobs'] = self.jobs #save to storage
 		# TODO is this a good idea? Trying to avoid cache problems where updates haven't come through?
 		# But this may not work if the same schedule is saved many times in a row, or if changes
@@ -282,22 +297,25 @@ class Scheduler(Plugin):
 
 	def run(self):
 		self.running = True
-		while self.running:
-			maintenanceJob = None
-			with self.maintenanceJobsLock:
-				if len(self.maintenanceJobs) > 0 and self.maintenanceJobs[0]['nextRunTime'] < time.time():
-					maintenanceJob = self.maintenanceJobs.pop(0)
-			self.runMaintenanceJob(maintenanceJob)
-
-			jobCopy = None
-			with self.jobsLock:
-				if len(self.jobs) > 0 and self.jobs[0]['nextRunTime'] < time.time():
-					#a job has passed its nextRunTime
-					job = self.jobs[0]
-					jobId = job['id']
-					jobCopy = copy.deepcopy(job) #make a copy, don't edit the original job
-
-			if jobCopy:
+		while True:
+			maintenanceJobs = []
+			dueJobs = []
+			with self.lock:
+				self.__waitForJobs()
+				if not self.running:
+					return
+				now = time.time()
+				while self.maintenanceJobs and self.maintenanceJobs[0][0] <= now:
+					maintenanceJobs.append(heapq.heappop(self.maintenanceJobs)[2])
+				while self.jobQueue and self.jobQueue[0][0] <= now:
+					dueJobs.append(heapq.heappop(self.jobQueue)[2])
+
+			for maintenanceJob in maintenanceJobs:
+				self.runMaintenanceJob(maintenanceJob)
+
+			for job in dueJobs:
+				#a job has passed its nextRunTime
+				jobCopy = dict(job) #make a copy, don't edit the original job
 				jobCopy['originalRepeats'] = job['reps']
 				# approximate maxRunTime, sanity check
 				jobCopy['maxRunTime'] = jobCopy['nextRunTime'] \
@@ -305,50 +323,44 @@ class Scheduler(Plugin):
 				                        + jobCopy['retry_interval'] * 60 * (jobCopy['retries'] + 1) \
 				                        + 70 \
 				                        + jobCopy['random_interval'] * 60
-				self.runningJobs[jobId] = jobCopy
-				self.calculateNextRunTime(job)
-				with self.jobsLock:
-					self.jobs.sort(key=lambda job: job['nextRunTime'])
+				active = self.calculateNextRunTime(job)
+				with self.lock:
+					self.__queueRunningJob(jobCopy)
+					# The job may have been removed or replaced while it was calculated
+					if active and any([x is job for x in self.jobs]):
+						self.__queueJob(job)
+
+			dueRunningJobs = []
+			with self.lock:
+				now = time.time()
+				while self.runningJobQueue and self.runningJobQueue[0][0] <= now:
+					runningJob = heapq.heappop(self.runningJobQueue)[2]
+					if self.runningJobs.get(runningJob['id']) is runningJob:
+						dueRunningJobs.append(runningJob)
 
 			jobsToRun = [] # jobs to run in a separate list, to avoid deadlocks (necessary?)
-			# Iterating using .keys(9 since we are modifiyng the dict while iterating
-			for runningJobId in self.runningJobs.keys():  # pylint: disable=C0201
-				runningJob = self.runningJobs[runningJobId]
-				if runningJob['nextRunTime'] < time.time():
-					if runningJob['maxRunTime'] > time.time():
-						if 'client_device_id' not in runningJob:
-							print "Missing client_device_id, this is an error, perhaps refetch jobs? "
-							print runningJob
-							continue
-						device = self.deviceManager.device(runningJob['client_device_id'])
-						if not device:
-							print "Missing device, b: " + str(runningJob['client_device_id'])
-							continue
-						if device.typeString() == '433' and runningJob['originalRepeats'] > 1:
-							#repeats for 433-devices only
-							runningJob['reps'] = int(runningJob['reps']) - 1
-							if runningJob['reps'] >= 0:
-								runningJob['nextRunTime'] = time.time() + 3
-								jobsToRun.append(runningJob)
-								continue
-
-						if runningJob['retries'] > 0:
-							runningJob['nextRunTime'] = time.time() + (runningJob['retry_interval'] * 60)
-							runningJob['retries'] = runningJob['retries'] - 1
-							runningJob['reps'] = runningJob['originalRepeats']
-							jobsToRun.append(runningJob)
-							continue
-
-					del self.runningJobs[runningJobId] #max run time passed or out of retries
+			for runningJob in dueRunningJobs:
+				runNow = self.__nextRun(runningJob)
+				with self.lock:
+					if self.runningJobs.get(runningJob['id']) is not runningJob:
+						# Replaced while we were checking it
+						continue
+					if runNow is False:
+						del self.runningJobs[runningJob['id']] #max run time passed or out of retries
+						continue
+					self.__queueRunningJob(runningJob)
+				if runNow:
+					jobsToRun.append(runningJob)
 
 			for jobToRun in jobsToRun:
 				self.runJob(jobToRun)
 
-			# TODO decide on a time (how often should we check for jobs to run, what resolution?)
-			time.sleep(5)
-
 	def stop(self):
-		self.running = False
+		with self.lock:
+			self.running = False
+			if self.wakeupTimer is not None:
+				self.wakeupTimer.cancel()
+			self.lock.notify()
 
 	def successfulJobRun(self, jobId, state, stateValue):
 		"""
@@ -396,3 +408,77 @@ class Scheduler(Plugin):
 				jobData['recurrence']
 			)
 		jobData['callback']()
+
+	def __nextRun(self, runningJob):
+		"""
+		Decide if a running job should be run now. Sets the time for the next
+		repeat or retry. Returns False if the job is done and None if it should
+		be checked again later without running it.
+		"""
+		if runningJob['maxRunTime'] <= time.time():
+			return False
+		if 'client_device_id' not in runningJob:
+			print "Missing client_device_id, this is an error, perhaps refetch jobs? "
+			print runningJob
+			return False
+		device = self.deviceManager.device(runningJob['client_device_id'])
+		if not device:
+			print "Missing device, b: " + str(runningJob['client_device_id'])
+			# The device may not have been loaded yet
+			runningJob['nextRunTime'] = time.time() + 5
+			return None
+		if device.typeString() == '433' and runningJob['originalRepeats'] > 1:
+			#repeats for 433-devices only
+			runningJob['reps'] = int(runningJob['reps']) - 1
+			if runningJob['reps'] >= 0:
+				runningJob['nextRunTime'] = time.time() + 3
+				return True
+
+		if runningJob['retries'] > 0:
+			runningJob['nextRunTime'] = time.time() + (runningJob['retry_interval'] * 60)
+			runningJob['retries'] = runningJob['retries'] - 1
+			runningJob['reps'] = runningJob['originalRepeats']
+			return True
+		return False
+
+	def __queueJob(self, job):
+		# Must be called with the lock held
+		heapq.heappush(self.jobQueue, (job['nextRunTime'], next(self.counter), job))
+		if self.jobQueue[0][2] is job:
+			self.lock.notify()
+
+	def __queueRunningJob(self, runningJob):
+		# Must be called with the lock held
+		self.runningJobs[runningJob['id']] = runningJob
+		heapq.heappush(self.runningJobQueue, (runningJob['nextRunTime'], next(self.counter), runningJob))
+		if self.runningJobQueue[0][2] is runningJob:
+			self.lock.notify()
+
+	def __waitForJobs(self):
+		# Must be called with the lock held. Sleeps until the first job is due
+		# or the thread is woken up because the jobs has changed.
+		# Condition.wait() with a timeout polls every 50 ms in Python 2 so a
+		# timer is used to wake the thread when the first job is due. It runs
+		# in the timer thread so a busy main thread does not delay the jobs.
+		while self.running:
+			nextRunTimes = [
+				queue[0][0] for queue in (self.maintenanceJobs, self.jobQueue, self.runningJobQueue)
+				if queue
+			]
+			if nextRunTimes:
+				nextRunTime = min(nextRunTimes)
+				delay = nextRunTime - time.time()
+				if delay <= 0:
+					return
+				if nextRunTime != self.wakeupTime:
+					if self.wakeupTimer is not None:
+						self.wakeupTimer.cancel()
+					self.wakeupTime = nextRunTime
+					self.wakeupTimer = Application().callLaterInTimerThread(delay, self.__wakeup)
+			self.lock.wait()
+
+	def __wakeup(self):
+		with self.lock:
+			self.wakeupTime = None
+			self.wakeupTimer = None
+			self.lock.notify()
@@ -272,6 +272,9 @@ class BlockheaterTrigger(TimeTrigger):
 		self.recalculate()
 
 class SuntimeCondition(Condition):
+	synchronous = True
+	cost = 5
+
 	def __init__(self, **kwargs):
 		super(SuntimeCondition, self).__init__(**kwargs)
 		self.sunStatus = None
@@ -332,6 +335,9 @@ class SuntimeCondition(Condition):
 			failure()
 
 class TimeCondition(Condition):
+	synchronous = True
+	cost = 2
+
 	def __init__(self, **kwargs):
 		super(TimeCondition, self).__init__(**kwargs)
 		self.fromMinute = None
@@ -381,6 +387,9 @@ class TimeCondition(Condition):
 				failure()
 
 class WeekdayCondition(Condition):
+	synchronous = True
+	cost = 2
+
 	def __init__(self, **kwargs):
 		super(WeekdayCondition, self).__init__(**kwargs)
 		self.weekdays = None
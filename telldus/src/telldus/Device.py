@@ -355,6 +355,32 @@ class Device(object):
 		pass
 
 	def setSensorValue(self, valueType, value, scale):
+		if not self.__storeSensorValue(valueType, value, scale):
+			return
+		if self._manager:
+			if self._manager.sensorValueUpdated(self, valueType, value, scale) is not False:
+				self._manager.save()
+
+	def setSensorValues(self, values):
+		"""
+		Set several sensor values received at the same time, e.g. temperature
+		and humidity from the same frame. Observers are notified once and the
+		devices are only stored once.
+
+		:param list values: A list of dicts with the keys `type`, `value` and `scale`
+		"""
+		updated = []
+		for value in values:
+			if self.__storeSensorValue(value['type'], value['value'], value['scale']):
+				updated.append((value['type'], value['value'], value['scale']))
+		if not updated:
+			return
+		if self._manager:
+			if self._manager.sensorValuesUpdated(self, updated) is not False:
+				self._manager.save()
+
+	def __storeSensorValue(self, valueType, value, scale):
+		"""Store the value. Returns False if the value should be ignored."""
 		if valueType not in self._sensorValues:
 			self._sensorValues[valueType] = []
 		found = False
@@ -367,7 +393,7 @@ class Device(object):
 					if sensorType['lastUpdated'] > int(time.time() - 1):
 						# Same value and less than a second ago, most probably
 						# just the same value being resent, ignore
-						return
+						return False
 				sensorType['value'] = str(value)
 				sensorType['lastUpdated'] = int(time.time())
 				found = True
@@ -379,9 +405,7 @@ class Device(object):
 				'lastUpdated': int(time.time())
 			})
 			self.valueChangedTime[valueType] = int(time.time())
-		if self._manager:
-			self._manager.sensorValueUpdated(self, valueType, value, scale)
-			self._manager.save()
+		return True
 
 	def setState(self, state, stateValue=None, ack=None, origin=None):
 		if stateValue is None:
@@ -524,7 +548,7 @@ class CachedDevice(Device):  # pylint: disable=R0902
 		if 'ignored' in settings:
 			self._ignored = settings['ignored']
 		if 'sensorValues' in settings:
-			self.setSensorValues(settings['sensorValues'])
+			self.loadSensorValues(settings['sensorValues'])
 		if 'isSensor' in settings:
 			self._isSensor = settings['isSensor']
 		if 'declaredDead' in settings:
@@ -545,7 +569,7 @@ class CachedDevice(Device):  # pylint: disable=R0902
 	def setParams(self, params):
 		self.paramsStorage = params
 
-	def setSensorValues(self, sensorValues):
+	def loadSensorValues(self, sensorValues):
 		# this method just fills cached values, no signals or reports are sent
 		for valueTypeFetch in sensorValues:
 			valueType = int(valueTypeFetch)
@@ -210,6 +210,22 @@ class DeviceApiManager(Plugin):
 		"""
 		return self.deviceSetName(id, name, **kwargs)
 
+	@apicall('sensor', 'setFilter')
+	def sensorSetFilter(self, valueType, id=None, deadband=None, minInterval=None, maxInterval=None, **kwargs):
+		"""
+		Limits how often values of a value type are reported. Values changing
+		less than deadband are not reported, unless the last report is older than
+		maxInterval seconds. Values are never reported more often than every
+		minInterval seconds. If id is set the filter only applies to this sensor.
+		Call without any limits to remove the filter.
+		"""
+		if id is not None:
+			id = self.__retrieveDevice(id).id()
+		DeviceManager(self.context).setSensorFilter(
+			int(valueType), id, deadband, minInterval, maxInterval
+		)
+		return True
+
 	def __retrieveDevice(self, deviceId):
 		deviceManager = DeviceManager(self.context)
 		device = deviceManager.device(int(deviceId))
@@ -1,8 +1,6 @@
 # -*- coding: utf-8 -*-
 
-from threading import Timer
-
-from base import Plugin, implements
+from base import Application, Plugin, implements
 from events.base import IEventFactory, Action, Condition, Trigger
 from .Device import Device
 from .DeviceManager import DeviceManager, IDeviceChange
@@ -12,13 +10,16 @@ class DeviceEventFactory(Plugin):
 	implements(IDeviceChange)
 
 	def __init__(self):
-		self.deviceTriggers = []
-		self.sensorTriggers = []
+		# Triggers by (deviceId, method) and by (sensorId, valueType, scale)
+		self.deviceTriggers = {}
+		self.sensorTriggers = {}
+		self.triggerKeys = {}
 		self.deviceManager = DeviceManager(self.context)  # pylint: disable=E1121
 
 	def clearAll(self):
-		self.deviceTriggers = []
-		self.sensorTriggers = []
+		self.deviceTriggers = {}
+		self.sensorTriggers = {}
+		self.triggerKeys = {}
 
 	def createAction(self, type, params, **kwargs):  # pylint: disable=W0622
 		if type == 'device':
@@ -39,49 +40,65 @@ class DeviceEventFactory(Plugin):
 	def createTrigger(self, type, **kwargs):  # pylint: disable=W0622
 		if type == 'device':
 			deviceTrigger = DeviceTrigger(self, **kwargs)
-			self.deviceTriggers.append(deviceTrigger)
+			self.indexTrigger(deviceTrigger)
 			return deviceTrigger
 		if type == 'sensor':
 			sensorTrigger = SensorTrigger(self, **kwargs)
-			self.sensorTriggers.append(sensorTrigger)
+			self.indexTrigger(sensorTrigger)
 			return sensorTrigger
 		return None
 
 	def deleteTrigger(self, trigger):
-		if trigger in self.deviceTriggers:
-			self.deviceTriggers.remove(trigger)
-		elif trigger in self.sensorTriggers:
-			self.sensorTriggers.remove(trigger)
+		index, key = self.triggerKeys.pop(trigger, (None, None))
+		if index is None:
+			return
+		triggers = index[key]
+		triggers.remove(trigger)
+		if not triggers:
+			del index[key]
+
+	def indexTrigger(self, trigger):
+		"""
+		Index the trigger by the device or sensor value it triggers on. This
+		must be called again if the parameters of the trigger changes.
+		"""
+		self.deleteTrigger(trigger)
+		if isinstance(trigger, DeviceTrigger):
+			index = self.deviceTriggers
+		else:
+			index = self.sensorTriggers
+		key = trigger.indexKey()
+		index.setdefault(key, []).append(trigger)
+		self.triggerKeys[trigger] = (index, key)
 
-	def sensorValueUpdated(self, device, valueType, value, scale):
-		for trigger in self.sensorTriggers:
-			if trigger.sensorId == device.id():
-				trigger.triggerSensorUpdate(valueType, value, scale)
+	def sensorValueReceived(self, device, valueType, value, scale):
+		# Triggers are evaluated on every value, before any sensor filtering
+		for trigger in self.sensorTriggers.get((device.id(), valueType, scale), []):
+			trigger.triggerSensorUpdate(valueType, value, scale)
 
 	def stateChanged(self, device, method, statevalue):
 		del statevalue
-		for trigger in self.deviceTriggers:
-			if trigger.deviceId == device.id() and trigger.method == int(method):
-				trigger.triggered({
-					'triggertype': 'device',
-					'clientdeviceid': device.id(),
-					'method': int(method)
-				})
+		for trigger in self.deviceTriggers.get((device.id(), int(method)), []):
+			trigger.triggered({
+				'triggertype': 'device',
+				'clientdeviceid': device.id(),
+				'method': int(method)
+			})
 
 class DeviceActionExecutor(object):
-	def __init__(self, device, method, value, repeats, description):
+	def __init__(self, device, method, value, repeats, description, trace=None):
 		self.device = device
 		self.method = method
 		self.value = value
 		self.repeats = repeats
 		self.description = description
+		self.trace = trace
 
 		if device.typeString() == '433' and self.repeats > 1:
 			self.retries = 0  # No retries for 433
 			i = 1
 			while i < self.repeats:
-				tmr = Timer(3*i, self.execute)
-				tmr.start()
+				Application().callLater(3*i, self.execute)
 				i += 1
 		else:
 			self.retries = self.repeats
@@ -92,15 +109,21 @@ class DeviceActionExecutor(object):
 			self.method,
 			self.value,
 			origin='Event - %s' % self.description,
+			success=self.__success,
 			failure=self.__failure
 		)
 
 	def __failure(self, reason):
 		del reason
+		if self.trace is not None:
+			self.trace.record('command', self.device.id(), 'failure')
 		self.retries -= 1
 		if self.retries > 0:
-			tmr = Timer(60, self.execute)
-			tmr.start()
+			Application().callLater(60, self.execute)
+
+	def __success(self, **__kwargs):
+		if self.trace is not None:
+			self.trace.record('command', self.device.id(), 'success')
 
 class DeviceAction(Action):
 	def __init__(self, manager, **kwargs):
@@ -133,10 +156,13 @@ class DeviceAction(Action):
 			self.method,
 			self.value,
 			self.repeats,
-			self.event.description
+			self.event.description,
+			self.trace
 		)
 
 class DeviceCondition(Condition):
+	synchronous = True
+
 	def __init__(self, manager, **kwargs):
 		super(DeviceCondition, self).__init__(**kwargs)
 		self.manager = manager
@@ -170,6 +196,13 @@ class DeviceTrigger(Trigger):
 	def close(self):
 		self.factory.deleteTrigger(self)
 
+	def indexKey(self):
+		return (self.deviceId, self.method)
+
+	def loadParams(self, params):
+		super(DeviceTrigger, self).loadParams(params)
+		self.factory.indexTrigger(self)
+
 	def parseParam(self, name, value):
 		if name == 'clientDeviceId':
 			self.deviceId = int(value)
@@ -177,6 +210,8 @@ class DeviceTrigger(Trigger):
 			self.method = int(value)
 
 class SensorCondition(Condition):
+	synchronous = True
+
 	def __init__(self, manager, **kwargs):
 		super(SensorCondition, self).__init__(**kwargs)
 		self.manager = manager
@@ -253,6 +288,13 @@ class SensorTrigger(Trigger):
 	def close(self):
 		self.factory.deleteTrigger(self)
 
+	def indexKey(self):
+		return (self.sensorId, self.valueType, self.scale)
+
+	def loadParams(self, params):
+		super(SensorTrigger, self).loadParams(params)
+		self.factory.indexTrigger(self)
+
 	def parseParam(self, name, value):
 		if name == 'clientSensorId':
 			self.sensorId = int(value)
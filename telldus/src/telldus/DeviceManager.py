@@ -16,6 +16,7 @@ from base import \
 	signal, \
 	slot
 from .Device import CachedDevice, DeviceAbortException
+from .SensorFilter import SensorFilter
 
 __name__ = 'telldus'  # pylint: disable=W0622
 
@@ -31,8 +32,24 @@ class IDeviceChange(IInterface):
 		"""
 	def deviceRemoved(deviceId):  # pylint: disable=E0213
 		"""This method is called when a device is removed"""
+	def sensorValueReceived(device, valueType, value, scale):  # pylint: disable=E0213
+		"""
+		This method is called for every sensor value received, before the
+		value is filtered by the sensor filters. Use this when every raw value
+		is needed, e.g. for local triggers.
+		"""
 	def sensorValueUpdated(device, valueType, value, scale):  # pylint: disable=E0213
-		"""This method is called when a new sensor value is received from a sensor"""
+		"""
+		This method is called when a new sensor value is received from a sensor.
+		Values filtered by the sensor filters are not reported.
+		"""
+	def sensorValuesUpdated(device, values):  # pylint: disable=E0213
+		"""
+		This method is called when several sensor values are received at the
+		same time. values is a list of (valueType, value, scale) tuples.
+		Observers not implementing this will get one call to
+		:func:`sensorValueUpdated` per value instead.
+		"""
 	def stateChanged(device, state, statevalue):  # pylint: disable=E0213
 		"""Called when the state of a device changed"""
 
@@ -48,6 +65,7 @@ class DeviceManager(Plugin):
 		self.devices = []
 		self.settings = Settings('telldus.devicemanager')
 		self.nextId = self.settings.get('nextId', 0)
+		self.sensorFilter = SensorFilter(self.settings)
 		self.live = TelldusLive(self.context)
 		self.registered = False
 		self.__load()
@@ -151,6 +169,7 @@ class DeviceManager(Plugin):
 		for i, device in enumerate(self.devices):
 			if device.id() == deviceId:
 				self.__deviceRemoved(deviceId)
+				self.sensorFilter.forget(deviceId)
 				isDevice = self.devices[i].isDevice()
 				del self.devices[i]
 				break
@@ -160,6 +179,31 @@ class DeviceManager(Plugin):
 			msg.append({'id': deviceId})
 			self.live.send(msg)
 
+	@mainthread
+	def removeDevices(self, deviceIds):
+		"""
+		Removes several devices. The devices are only saved once.
+
+		.. warning::
+		    This function may only be called by the module supplying the devices
+		    since removing of a device may be transport specific.
+		"""
+		deviceIds = set(deviceIds)
+		removed = [device for device in self.devices if device.id() in deviceIds]
+		self.devices[:] = [device for device in self.devices if device.id() not in deviceIds]
+		for device in removed:
+			self.__deviceRemoved(device.id())
+			self.sensorFilter.forget(device.id())
+		self.save()
+		if not self.live.registered:
+			return
+		for device in removed:
+			if not device.isDevice():
+				continue
+			msg = LiveMessage("DeviceRemoved")
+			msg.append({'id': device.id()})
+			self.live.send(msg)
+
 	@mainthread
 	def removeDevicesByType(self, deviceType):
 		"""
@@ -190,57 +234,56 @@ class DeviceManager(Plugin):
 			lst.append(device)
 		return lst
 
-	@signal
 	def sensorValueUpdated(self, device, valueType, value, scale):
 		"""
 		Called every time a sensors value is updated.
+
+		:returns: False if the value was not reported because of the sensor
+		  filters. The device does not need to be saved in this case.
 		"""
-		if device.isSensor() is False:
-			return
-		self.observers.sensorValueUpdated(device, valueType, value, scale)
-		if not self.live.registered or device.ignored():
-			# don't send if not connected to live or sensor is ignored
-			return
-		if valueType in device.lastUpdatedLive \
-		   and (valueType in device.valueChangedTime \
-		   and device.valueChangedTime[valueType] < device.lastUpdatedLive[valueType]) \
-		   and device.lastUpdatedLive[valueType] > (int(time.time()) - 300):
-			# no values have changed since the last live-update, and the last
-			# time this sensor was sent to live was less than 5 minutes ago
-			return
+		return self.sensorValuesUpdated(device, [(valueType, value, scale)])
 
-		msg = LiveMessage("SensorEvent")
-		# pcc = packageCountChecked - already checked package count,
-		# just accept it server side directly
-		sensor = {
-			'name': device.name(),
-			'protocol': device.protocol(),
-			'model': device.model(),
-			'sensor_id': device.id(),
-			'pcc': 1,
-		}
+	def sensorValuesUpdated(self, device, values):
+		"""
+		Called when several values of a sensor are updated at once. values is a
+		list of (valueType, value, scale) tuples. Only one SensorEvent is sent
+		to Telldus Live! for all values.
 
-		battery = device.battery()
-		if battery is not None:
-			sensor['battery'] = battery
-		msg.append(sensor)
-		# small clarification: valueType etc that is sent in here is only used for sending
-		# information about what have changed on to observers, below is instead all the values
-		# of the sensor picked up and sent in a sensor event-message (the sensor values
-		# have already been updated in other words)
-		values = device.sensorValues()
-		valueList = []
-		for valueType in values:
-			for value in values[valueType]:
-				valueList.append({
-					'type': valueType,
-					'lastUp': str(value['lastUpdated']),
-					'value': str(value['value']),
-					'scale': value['scale']
-				})
-		msg.append(valueList)
-		device.lastUpdatedLive[valueType] = int(time.time())
-		self.live.send(msg)
+		:returns: False if no value was reported because of the sensor filters
+		"""
+		if device.isSensor() is False:
+			# Not reported, but the values must still be saved
+			return None
+		observers = self.observers
+		for valueType, value, scale in values:
+			observers.sensorValueReceived(device, valueType, value, scale)
+		values = [
+			(valueType, value, scale) for (valueType, value, scale) in values
+			if self.sensorFilter.accept(device, valueType, value, scale)
+		]
+		if not values:
+			return False
+		for observer in observers:
+			# Look at the class, unimplemented interface methods are always
+			# available on the instance
+			if hasattr(type(observer), 'sensorValuesUpdated'):
+				observer.sensorValuesUpdated(device, values)
+				continue
+			for valueType, value, scale in values:
+				observer.sensorValueUpdated(device, valueType, value, scale)
+		for valueType, value, scale in values:
+			self.__sensorValueUpdated(device, valueType, value, scale)
+		self.__sendSensorEvent(device, [valueType for (valueType, __value, __scale) in values])
+		return True
+
+	def setSensorFilter(self, valueType, deviceId=None, deadband=None, minInterval=None, maxInterval=None):
+		"""
+		Limit how often values of a value type are reported. See
+		:class:`SensorFilter` for a description of the limits.
+
+		:param int deviceId: Set the filter for this sensor only
+		"""
+		self.sensorFilter.setFilter(valueType, deviceId, deadband, minInterval, maxInterval)
 
 	def stateUpdated(self, device, ackId=None, origin=None):
 		if device.isDevice() is False:
@@ -432,6 +475,14 @@ class DeviceManager(Plugin):
 		del origin  # Remove pylint warning
 		self.observers.stateChanged(device, state, stateValue)
 
+	@signal('sensorValueUpdated')
+	def __sensorValueUpdated(self, device, valueType, value, scale):
+		"""
+		Called every time a sensors value is updated. Values filtered by the
+		sensor filters are not signaled.
+		"""
+		pass
+
 	def save(self):
 		data = []
 		for device in self.devices:
@@ -460,6 +511,57 @@ class DeviceManager(Plugin):
 		self.settings['devices'] = data
 		self.settings['nextId'] = self.nextId
 
+	def __sendSensorEvent(self, device, valueTypes):
+		if not self.live.registered or device.ignored():
+			# don't send if not connected to live or sensor is ignored
+			return
+		now = int(time.time())
+		for valueType in valueTypes:
+			if valueType in device.lastUpdatedLive \
+			   and (valueType in device.valueChangedTime \
+			   and device.valueChangedTime[valueType] < device.lastUpdatedLive[valueType]) \
+			   and device.lastUpdatedLive[valueType] > (now - 300):
+				# no values have changed since the last live-update, and the last
+				# time this sensor was sent to live was less than 5 minutes ago
+				continue
+			break
+		else:
+			return
+
+		msg = LiveMessage("SensorEvent")
+		# pcc = packageCountChecked - already checked package count,
+		# just accept it server side directly
+		sensor = {
+			'name': device.name(),
+			'protocol': device.protocol(),
+			'model': device.model(),
+			'sensor_id': device.id(),
+			'pcc': 1,
+		}
+
+		battery = device.battery()
+		if battery is not None:
+			sensor['battery'] = battery
+		msg.append(sensor)
+		# small clarification: valueType etc that is sent in here is only used for sending
+		# information about what have changed on to observers, below is instead all the values
+		# of the sensor picked up and sent in a sensor event-message (the sensor values
+		# have already been updated in other words)
+		values = device.sensorValues()
+		valueList = []
+		for valueType in values:
+			for value in values[valueType]:
+				valueList.append({
+					'type': valueType,
+					'lastUp': str(value['lastUpdated']),
+					'value': str(value['value']),
+					'scale': value['scale']
+				})
+		msg.append(valueList)
+		for valueType in valueTypes:
+			device.lastUpdatedLive[valueType] = now
+		self.live.send(msg)
+
 	def __sendDeviceReport(self):
 		logging.warning("Send Devices Report")
 		if not self.live.registered:
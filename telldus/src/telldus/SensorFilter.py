@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+
+import time
+
+class SensorFilter(object):
+	"""
+	Decides if a received sensor value is significant enough to be reported.
+
+	Filters can be set for a value type (e.g. all temperatures) and be
+	overridden for a single sensor. A filter is a dict with these optional
+	keys:
+
+	``deadband``
+	  Only report the value if it differs at least this much from the last
+	  reported value.
+	``minInterval``
+	  Never report more often than once per this many seconds.
+	``maxInterval``
+	  Always report if the last report is older than this many seconds, even
+	  if the value has not changed enough.
+	"""
+
+	# Used for maxInterval if a filter does not set one
+	DEFAULT_MAX_INTERVAL = 900
+
+	def __init__(self, settings):
+		self.settings = settings
+		self.filters = settings.get('sensorFilters', {})
+		self.lastReported = {}
+
+	def accept(self, device, valueType, value, scale):
+		"""Returns True if the value should be reported"""
+		sensorFilter = self.filterFor(device.id(), valueType)
+		key = (device.id(), valueType, scale)
+		now = time.time()
+		if sensorFilter is not None and key in self.lastReported:
+			lastValue, lastTime = self.lastReported[key]
+			elapsed = now - lastTime
+			if elapsed < sensorFilter.get('maxInterval', SensorFilter.DEFAULT_MAX_INTERVAL):
+				if elapsed < sensorFilter.get('minInterval', 0):
+					return False
+				try:
+					if abs(float(value) - lastValue) < sensorFilter.get('deadband', 0):
+						return False
+				except (TypeError, ValueError):
+					pass
+		try:
+			self.lastReported[key] = (float(value), now)
+		except (TypeError, ValueError):
+			self.lastReported[key] = (None, now)
+		return True
+
+	def filterFor(self, deviceId, valueType):
+		"""Returns the filter for a sensor value, or None if the value is not filtered"""
+		sensorFilters = self.filters.get('sensors', {}).get(str(deviceId), {})
+		if str(valueType) in sensorFilters:
+			return sensorFilters[str(valueType)] or None
+		return self.filters.get('types', {}).get(str(valueType))
+
+	def forget(self, deviceId):
+		"""Remove all state for a removed sensor"""
+		for key in [key for key in self.lastReported if key[0] == deviceId]:
+			del self.lastReported[key]
+		if self.filters.get('sensors', {}).pop(str(deviceId), None) is not None:
+			self.settings['sensorFilters'] = self.filters
+
+	def setFilter(self, valueType, deviceId=None, deadband=None, minInterval=None, maxInterval=None):
+		"""
+		Set the filter for a value type, for all sensors or for one sensor. Set
+		it without any limits to remove it. For a single sensor this disables
+		filtering of the value even if there is a filter for the value type.
+		"""
+		sensorFilter = {}
+		for key, value in [('deadband', deadband), ('minInterval', minInterval), ('maxInterval', maxInterval)]:
+			if value is not None:
+				sensorFilter[key] = float(value)
+		if deviceId is None:
+			types = self.filters.setdefault('types', {})
+			if sensorFilter:
+				types[str(valueType)] = sensorFilter
+			else:
+				types.pop(str(valueType), None)
+		else:
+			sensors = self.filters.setdefault('sensors', {})
+			sensors.setdefault(str(deviceId), {})[str(valueType)] = sensorFilter
+		self.settings['sensorFilters'] = self.filters